@@ -0,0 +1,64 @@
+from travellings_graph.analyzer import analyze_connection, reverse_graph
+from travellings_graph.build_compare import attribute_edges, member_deltas
+
+MEMBER_IDS = [1, 2, 3, 4, 5, 6]
+
+
+def metrics_of(edges: list[tuple[int, int]]) -> dict[int, dict]:
+    # the same values as the analyzer's items
+    index_of = {member_id: index for index, member_id in enumerate(MEMBER_IDS)}
+    successors: list[dict[int, None]] = [{} for _ in MEMBER_IDS]
+    for source, target in edges:
+        successors[index_of[source]][index_of[target]] = None
+    outgoing = analyze_connection(MEMBER_IDS, successors)
+    incoming = analyze_connection(MEMBER_IDS, reverse_graph(successors))
+    return {
+        member_id: {
+            "outgoing_count": out.connection_count,
+            "outgoing_count_in6degrees": out.connection_in6degrees,
+            "outgoing_average_distance": round(out.avg_distance, 4),
+            "incoming_count": into.connection_count,
+            "incoming_count_in6degrees": into.connection_in6degrees,
+            "incoming_average_distance": round(into.avg_distance, 4),
+        }
+        for member_id, out, into in zip(MEMBER_IDS, outgoing, incoming)
+    }
+
+
+def test_attribution_scores_sum_to_count_deltas():
+    # 1 -> 2 -> 3    4 -> 5 -> 6   becomes   1 -> 2 -> 3 -> 4 -> 5    6 -> 1
+    previous_edges = [(1, 2), (2, 3), (4, 5), (5, 6)]
+    current_edges = [(1, 2), (2, 3), (3, 4), (4, 5), (6, 1)]
+    added = [(3, 4), (6, 1)]
+    removed = [(5, 6)]
+    deltas = member_deltas(metrics_of(previous_edges), metrics_of(current_edges))
+    attributions = attribute_edges(
+        previous_edges, current_edges, added, removed, deltas
+    )
+
+    assert sorted((a.source, a.target, a.added) for a in attributions) == [
+        (3, 4, True),
+        (5, 6, False),
+        (6, 1, True),
+    ]
+    count_deltas = sum(
+        abs(delta.deltas[column])
+        for delta in deltas
+        for column in [
+            "outgoing_count",
+            "outgoing_count_in6degrees",
+            "incoming_count",
+            "incoming_count_in6degrees",
+        ]
+    )
+    assert count_deltas > 0
+    assert abs(sum(a.score for a in attributions) - count_deltas) < 1e-9
+
+    by_edge = {(a.source, a.target): a for a in attributions}
+    # 1, 2, 3 and, through the other added edge, 6 now reach 4 and 5
+    assert by_edge[(3, 4)].affected_sources == 4
+    assert by_edge[(3, 4)].affected_targets == 2
+    # only 4 and 5 reached 6
+    assert by_edge[(5, 6)].affected_sources == 2
+    assert by_edge[(5, 6)].affected_targets == 1
+    assert attributions == sorted(attributions, key=lambda a: a.score, reverse=True)
@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import scrapy
+from scrapy.crawler import CrawlerProcess
+from travellings_graph.crawl_checkpoint import CrawlCheckpoint
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# /moved/ is redirected once, /flaky/ fails with 503 once before it succeeds,
+# and every homepage links to a friends page of the same member
+class StubHandler(BaseHTTPRequestHandler):
+    failed: set[str] = set()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path == "/moved/":
+            self.send_response(301)
+            self.send_header("Location", "/moved/home")
+            self.end_headers()
+            return
+        if self.path == "/flaky/" and self.path not in StubHandler.failed:
+            StubHandler.failed.add(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = b'<html><body><a href="friends">friends</a></body></html>'
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class StubSpider(scrapy.Spider):
+    name = "checkpoint_stub"
+
+    def __init__(self, starts: list[str], checkpoint: CrawlCheckpoint, **kwargs):
+        super().__init__(**kwargs)
+        self.starts = starts
+        self.checkpoint = checkpoint
+
+    def start_requests(self):
+        for start in self.starts:
+            yield scrapy.Request(
+                start, cb_kwargs={"start": start}, errback=self.on_request_error
+            )
+
+    def on_request_error(self, failure):
+        self.checkpoint.request_finished(failure.request)
+
+    def parse(self, response, **kwargs):
+        yield {"start": kwargs["start"], "url": response.url}
+        if not response.url.endswith("/friends"):
+            yield response.follow(
+                "friends", cb_kwargs=kwargs, errback=self.on_request_error
+            )
+
+
+def run_crawl(base_url: str, state_path: str):
+    checkpoint = CrawlCheckpoint(
+        os.path.join(state_path, "friends.lines.json"),
+        os.path.join(state_path, "crawl-state"),
+    )
+    checkpoint.open()
+    process = CrawlerProcess(
+        settings={
+            "LOG_LEVEL": "ERROR",
+            "TELNETCONSOLE_ENABLED": False,
+            "RETRY_HTTP_CODES": [503],
+            "SPIDER_MIDDLEWARES": {
+                "travellings_graph.crawl_checkpoint.CheckpointMiddleware": 1000,
+            },
+            "ITEM_PIPELINES": {
+                "travellings_graph.crawl_checkpoint.CheckpointPipeline": 1000,
+            },
+        }
+    )
+    starts = [f"{base_url}/moved/", f"{base_url}/flaky/", f"{base_url}/plain/"]
+    process.crawl(StubSpider, starts=starts, checkpoint=checkpoint)
+    process.start()
+    # keep the state, so the test can see the completion markers
+    checkpoint.close(finished=False)
+
+
+def test_redirected_and_retried_members_are_completed(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # the reactor cannot be restarted, so every crawl runs in its own process
+        subprocess.run(
+            [sys.executable, __file__, base_url, str(tmp_path)],
+            env={**os.environ, "PYTHONPATH": REPO_ROOT},
+            check=True,
+            timeout=60,
+        )
+    finally:
+        server.shutdown()
+
+    checkpoint = CrawlCheckpoint(
+        str(tmp_path / "friends.lines.json"), str(tmp_path / "crawl-state")
+    )
+    assert checkpoint.read_completed() == {
+        f"{base_url}/moved/",
+        f"{base_url}/flaky/",
+        f"{base_url}/plain/",
+    }
+    with open(checkpoint.output_path, "r", encoding="utf-8") as f:
+        urls = {json.loads(line)["url"] for line in f}
+    assert f"{base_url}/moved/friends" in urls
+    assert f"{base_url}/flaky/friends" in urls
+
+
+if __name__ == "__main__":
+    run_crawl(sys.argv[1], sys.argv[2])
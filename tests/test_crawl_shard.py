@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import pytest
+from travellings_graph.crawl_shard import (
+    merge_shards,
+    parse_shard,
+    shard_meta_path,
+    shard_of_url,
+    shard_output_path,
+    shard_state_dir,
+)
+
+
+def test_parse_shard():
+    assert parse_shard("2/3") == (2, 3)
+    assert parse_shard(" 1 / 1 ") == (1, 1)
+    for spec in ["0/3", "4/3", "1/0", "3", "a/b"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(spec)
+
+
+def test_shard_of_url_partitions_by_host():
+    urls = [f"https://blog{i}.example.com/" for i in range(200)]
+    for count in [1, 2, 5]:
+        shards = [shard_of_url(url, count) for url in urls]
+        assert set(shards) <= set(range(1, count + 1))
+        # stable, so every shard process computes the same partition
+        assert shards == [shard_of_url(url, count) for url in urls]
+    assert len({shard_of_url(url, 5) for url in urls}) == 5
+    # members on the same host always land in the same shard
+    assert shard_of_url("https://www.example.com/", 7) == shard_of_url(
+        "http://example.com/blog/", 7
+    )
+
+
+def write_shard(
+    index: int, count: int, records: list[dict], version: str | None = "v1"
+):
+    with open(shard_output_path(index, count), "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    if version is not None:
+        with open(shard_meta_path(index, count), "w", encoding="utf-8") as f:
+            json.dump({"members_version": version}, f)
+
+
+def merge_error(capsys, paths: list[str] | None = None) -> str:
+    with pytest.raises(SystemExit):
+        merge_shards(paths)
+    return capsys.readouterr().out
+
+
+def test_merge_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    link = {
+        "kind": "friends_link",
+        "start": "https://a.example/",
+        "target": "https://b.example/",
+    }
+    write_shard(1, 2, [link, link])
+    write_shard(
+        2, 2, [link, {"kind": "no_friends_page", "start": "https://c.example/"}]
+    )
+    merge_shards()
+    with open("friends.lines.json", "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_merge_rejects_invalid_shards(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    write_shard(1, 3, [])
+    write_shard(3, 3, [])
+    assert "Missing shard outputs: [2]" in merge_error(capsys)
+
+    write_shard(2, 3, [], version="v2")
+    assert "different member lists" in merge_error(capsys)
+
+    write_shard(2, 3, [], version=None)
+    os.remove(shard_meta_path(2, 3))
+    assert "no member list version" in merge_error(capsys)
+
+    write_shard(2, 3, [])
+    os.makedirs(shard_state_dir(2, 3))
+    assert "not finished yet" in merge_error(capsys)
+    os.rmdir(shard_state_dir(2, 3))
+
+    write_shard(1, 2, [])
+    assert "different shard counts" in merge_error(capsys)
+    os.remove(shard_output_path(1, 2))
+
+    with open("friends.other.lines.json", "w", encoding="utf-8") as f:
+        f.write("{}\n")
+    paths = [shard_output_path(i, 3) for i in range(1, 4)] + [
+        "friends.other.lines.json"
+    ]
+    assert "is not a shard output" in merge_error(capsys, paths)
+    assert not os.path.exists("friends.lines.json")
+
+    merge_shards()
+    assert os.path.exists("friends.lines.json")
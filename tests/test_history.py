@@ -0,0 +1,74 @@
+import random
+import pytest
+from travellings_graph.history import (
+    KEYFRAME_INTERVAL,
+    BuildHistory,
+    edge_key,
+)
+from travellings_graph.snapshot import ANALYSIS_FLOAT_COLUMNS, ANALYSIS_INT_COLUMNS
+
+
+def build_info(build: int) -> dict:
+    return {
+        "build_time": f"2024-01-{build + 1:02}T00:00:00",
+        "members": 40,
+        "connections": 0,
+    }
+
+
+def items(build: int) -> list[dict]:
+    return [
+        {"id": member_id}
+        | {column: member_id + build for column in ANALYSIS_INT_COLUMNS}
+        | {column: member_id / 2 for column in ANALYSIS_FLOAT_COLUMNS}
+        for member_id in range(1, 41)
+    ]
+
+
+def keys(edges: set[tuple[int, int]]) -> set[int]:
+    return {edge_key(source, target) for source, target in edges}
+
+
+def test_record_and_replay_builds(tmp_path):
+    rng = random.Random(3)
+    history = BuildHistory(str(tmp_path / "history"))
+    edges = {(rng.randint(1, 40), rng.randint(1, 40)) for _ in range(200)}
+    recorded = []
+    for build in range(2 * KEYFRAME_INTERVAL + 3):
+        # a few edges change between builds, so the builds in between are deltas
+        edges -= set(rng.sample(sorted(edges), 5))
+        edges |= {(rng.randint(1, 40), rng.randint(1, 40)) for _ in range(5)}
+        history.record(build_info(build), items(build), edges)
+        recorded.append(set(edges))
+
+    # reopened from the manifest
+    history = BuildHistory(str(tmp_path / "history"))
+    assert len(history) == len(recorded)
+    assert [
+        position for position, build in enumerate(history.builds) if build["keyframe"]
+    ] == [0, KEYFRAME_INTERVAL, 2 * KEYFRAME_INTERVAL]
+    for position, expected in enumerate(recorded):
+        assert history.edges_at(position) == keys(expected)
+    metrics = history.metrics_at(5, 7)
+    assert metrics is not None and metrics[ANALYSIS_INT_COLUMNS[0]] == 12
+    assert history.metrics_at(5, 99) is None
+    assert history.find("2024-01-06T12:00:00") == 5
+    assert history.find("2023-12-31T00:00:00") is None
+
+    # analyzed again within the same second, the last build is replaced
+    last = len(recorded) - 1
+    edges = recorded[-1] | {(1, 2), (2, 3)}
+    history.record(build_info(last), items(last), edges)
+    assert len(history) == len(recorded)
+    assert not history.builds[-1]["keyframe"]
+    assert history.edges_at(last) == keys(edges)
+    assert history.edges_at(last - 1) == keys(recorded[-2])
+
+    # a delta larger than the edge set is stored as a keyframe
+    edges = {(source, source % 40 + 1) for source in range(1, 41)}
+    history.record(build_info(last + 1), items(last + 1), edges)
+    assert history.builds[-1]["keyframe"]
+    assert history.edges_at(last + 1) == keys(edges)
+
+    with pytest.raises(ValueError):
+        history.record(build_info(0), items(0), edges)
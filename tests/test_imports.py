@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(module: str) -> set[str]:
+    # a fresh interpreter, so the modules loaded by the other tests don't count
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print('\\n'.join(sys.modules))"],
+        env={**os.environ, "PYTHONPATH": REPO_ROOT},
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return {name.split(".")[0] for name in result.stdout.split()}
+
+
+@pytest.mark.parametrize(
+    "module, heavy",
+    [
+        # `--help` and argument parsing load no subsystem
+        (
+            "travellings_graph.__main__",
+            ["scrapy", "twisted", "networkx", "fastapi", "pydantic", "hypercorn"],
+        ),
+        # the server does not load the crawler, nor NetworkX unless it rebuilds the snapshot
+        ("travellings_graph.server", ["scrapy", "twisted", "networkx"]),
+    ],
+)
+def test_import_does_not_load_heavy_modules(module: str, heavy: list[str]):
+    assert imported_modules(module) & set(heavy) == set()
@@ -0,0 +1,91 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from travellings_graph.member_list import (
+    read_pending_diff,
+    settle_pending_diff,
+    sync_members,
+)
+
+
+def member(member_id: int, url: str) -> dict:
+    return {
+        "id": member_id,
+        "name": f"Blog {member_id}",
+        "status": "RUN",
+        "url": url,
+        "tag": "",
+        "failedReason": None,
+    }
+
+
+# the list API, which answers 304 when the client already has the current version
+class ListHandler(BaseHTTPRequestHandler):
+    members: list[dict] = []
+    version = 0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        etag = f'"v{ListHandler.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps({"data": ListHandler.members}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture(name="list_url")
+def fixture_list_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ListHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/all"
+    server.shutdown()
+
+
+def test_sync_keeps_changes_pending_until_settled(list_url, tmp_path):
+    paths = {
+        "path": str(tmp_path / "members.json"),
+        "meta_path": str(tmp_path / "members.meta.json"),
+        "diff_path": str(tmp_path / "members.diff.json"),
+    }
+    ListHandler.members = [
+        member(1, "https://a.example/"),
+        member(2, "https://b.example/"),
+    ]
+    ListHandler.version = 1
+    diff = sync_members(list_url, **paths)
+    assert diff.modified and diff.changed_ids() == {1, 2}
+
+    # not modified, but the first changes were not crawled yet
+    diff = sync_members(list_url, **paths)
+    assert not diff.modified and diff.changed_ids() == {1, 2}
+
+    ListHandler.members = [
+        member(1, "https://a2.example/"),
+        member(3, "https://c.example/"),
+    ]
+    ListHandler.version = 2
+    diff = sync_members(list_url, **paths)
+    assert diff.modified and diff.changed_ids() == {1, 2, 3}
+    assert diff.url_changed == [
+        {"id": 1, "old": "https://a.example/", "new": "https://a2.example/"}
+    ]
+    assert diff.removed == [{"id": 2, "url": "https://b.example/"}]
+    pending = read_pending_diff(paths["diff_path"])
+    assert pending is not None and pending.changed_ids() == {1, 2, 3}
+
+    settle_pending_diff(paths["diff_path"])
+    assert read_pending_diff(paths["diff_path"]) is None
+    diff = sync_members(list_url, **paths)
+    assert not diff.modified and diff.changed_ids() == set()
+    with open(paths["diff_path"], "r", encoding="utf-8") as f:
+        assert not json.load(f)["pending"]
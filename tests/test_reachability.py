@@ -0,0 +1,92 @@
+import random
+import networkx as nx
+from travellings_graph.reachability import (
+    CONTAINER_ARRAY,
+    CONTAINER_BITMAP,
+    REACHABILITY_DIRECTIONS,
+    ReachabilityBuilder,
+    ReachabilityIndex,
+    bitset_members,
+)
+
+
+def bfs_levels(graph: nx.DiGraph, source: int) -> list[list[int]]:
+    distances = nx.single_source_shortest_path_length(graph, source)
+    levels: list[list[int]] = [[] for _ in range(max(distances.values()) + 1)]
+    for node, distance in distances.items():
+        levels[distance].append(node)
+    return levels
+
+
+def random_graph(rng: random.Random, node_count: int) -> dict[str, nx.DiGraph]:
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(node_count))
+    # a hub reaching everyone makes dense sets (bitmaps), the rest are sparse (arrays)
+    graph.add_edges_from((0, node) for node in range(1, node_count))
+    for _ in range(node_count * 2 if node_count > 1 else 0):
+        source, target = rng.randrange(1, node_count), rng.randrange(node_count)
+        if source != target:
+            graph.add_edge(source, target)
+    return {"out": graph, "in": graph.reverse()}
+
+
+def write_index(graphs: dict[str, nx.DiGraph], path: str) -> ReachabilityIndex:
+    node_count = len(graphs["out"])
+    builder = ReachabilityBuilder(list(range(1000, 1000 + node_count)))
+    for direction in REACHABILITY_DIRECTIONS:
+        for index in range(node_count):
+            builder.add(direction, index, bfs_levels(graphs[direction], index))
+    builder.write(path)
+    return ReachabilityIndex.open(path)
+
+
+def check_source(
+    reachability: ReachabilityIndex, direction: str, levels: list[list[int]]
+):
+    index = levels[0][0]
+    distances = {
+        node: distance for distance, level in enumerate(levels) for node in level
+    }
+    for max_hops in [1, 3, 6]:
+        within = [node for level in levels[1 : max_hops + 1] for node in sorted(level)]
+        assert reachability.members(direction, index, max_hops) == within
+        assert reachability.count(direction, index, max_hops) == len(within)
+        bitset = reachability.bitset(direction, index, max_hops)
+        assert list(bitset_members(bitset)) == sorted(within)
+        for other in range(len(reachability)):
+            expected = distances.get(other)
+            if expected == 0 or (expected is not None and expected > max_hops):
+                expected = None
+            assert reachability.distance(direction, index, other, max_hops) == expected
+
+
+def test_reachability_index_matches_bfs(tmp_path):
+    rng = random.Random(7)
+    for node_count in [1, 2, 70, 300]:
+        graphs = random_graph(rng, node_count)
+        reachability = write_index(
+            graphs, str(tmp_path / f"reachability-{node_count}.bin")
+        )
+        assert list(reachability.ids) == list(range(1000, 1000 + node_count))
+        kinds = set()
+        for direction in REACHABILITY_DIRECTIONS:
+            kinds.update(reachability.kinds[direction])
+            for index in range(node_count):
+                check_source(
+                    reachability, direction, bfs_levels(graphs[direction], index)
+                )
+        if node_count >= 70:
+            # the hub's set is dense and the leaves' sets are sparse
+            assert kinds == {CONTAINER_ARRAY, CONTAINER_BITMAP}
+
+
+def test_bitset_members():
+    assert not list(bitset_members(0))
+    assert list(bitset_members(1)) == [0]
+    nodes = [0, 7, 8, 63, 64, 1000]
+    assert list(bitset_members(sum(1 << node for node in nodes))) == nodes
+
+
+def test_empty_index():
+    reachability = ReachabilityIndex.empty()
+    assert len(reachability) == 0
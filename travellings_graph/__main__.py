@@ -1,19 +1,59 @@
 import argparse
-from travellings_graph.analyzer import run_analyzer
-from travellings_graph.friend_spider import run_spider
-from travellings_graph.server import run_server
+from travellings_graph.crawl_shard import merge_shards, parse_shard
+from travellings_graph.graph_export import parse_export_formats
 
+# Subsystems are imported by their command only, so e.g. `serve` does not load Scrapy,
+# and `--help` loads none of them.
+# pylint: disable=import-outside-toplevel
 
-def command_crawl(_args):
-    run_spider()
 
+def command_crawl(args):
+    from travellings_graph.friend_spider import run_spider
 
-def command_analyze(_args):
-    run_analyzer()
+    run_spider(fresh=args.fresh, shard=args.shard, keep_external=args.keep_external)
+
+
+def command_merge(args):
+    from travellings_graph.member_list import settle_pending_diff
+
+    merge_shards(args.inputs)
+    settle_pending_diff()
+
+
+def command_analyze(args):
+    from travellings_graph.analyzer import run_analyzer
+
+    run_analyzer(export_formats=args.export, compare=args.compare)
+
+
+def command_history_builds(_args):
+    from travellings_graph.history import print_builds
+
+    print_builds()
+
+
+def command_history_diff(args):
+    from travellings_graph.history import print_edge_diff
+
+    print_edge_diff(args.from_build, args.to_build)
+
+
+def command_history_member(args):
+    from travellings_graph.history import print_member_metrics
+
+    print_member_metrics(args.member_id)
+
+
+def command_history_distance(args):
+    from travellings_graph.history import print_distance
+
+    print_distance(args.source_id, args.target_id, args.at)
 
 
 def command_serve(args):
-    run_server(args.bind)
+    from travellings_graph.server import run_server
+
+    run_server(args.bind, workers=args.workers)
 
 
 def main():
@@ -21,13 +61,82 @@ def main():
     subparsers = parser.add_subparsers()
 
     parser_crawl = subparsers.add_parser("crawl")
+    parser_crawl.add_argument(
+        "--fresh",
+        action="store_true",
+        help="discard the checkpoint of an unfinished crawl and start over",
+    )
+    parser_crawl.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="i/N",
+        help="crawl only the i-th of N partitions of the members (1-based)",
+    )
+    parser_crawl.add_argument(
+        "--keep-external",
+        action="store_true",
+        help="save the links to non-members in friends.external.lines.json.gz",
+    )
     parser_crawl.set_defaults(handler=command_crawl)
 
+    parser_merge = subparsers.add_parser("merge")
+    parser_merge.add_argument(
+        "inputs",
+        nargs="*",
+        help="shard outputs to merge (default: all friends.shard-*-of-*.lines.json)",
+    )
+    parser_merge.set_defaults(handler=command_merge)
+
     parser_analyze = subparsers.add_parser("analyze")
+    parser_analyze.add_argument(
+        "--export",
+        type=parse_export_formats,
+        default=["gexf"],
+        metavar="FORMATS",
+        help="comma-separated graph exports among gexf, graphml, edgelist and binary "
+        + "(default: gexf, empty to skip)",
+    )
+    parser_analyze.add_argument(
+        "--compare",
+        metavar="BUILD",
+        help="compare with a recorded build (its build time, or `previous`), "
+        + "and save the changes in analysis-diff.csv and analysis.md",
+    )
     parser_analyze.set_defaults(handler=command_analyze)
 
+    parser_history = subparsers.add_parser("history")
+    history_subparsers = parser_history.add_subparsers()
+    parser_history.set_defaults(handler=command_history_builds)
+    parser_history_builds = history_subparsers.add_parser("builds")
+    parser_history_builds.set_defaults(handler=command_history_builds)
+    parser_history_diff = history_subparsers.add_parser("diff")
+    parser_history_diff.add_argument(
+        "from_build", help="build time, or any time after it"
+    )
+    parser_history_diff.add_argument(
+        "to_build", nargs="?", help="build time (default: the latest)"
+    )
+    parser_history_diff.set_defaults(handler=command_history_diff)
+    parser_history_member = history_subparsers.add_parser("member")
+    parser_history_member.add_argument("member_id", type=int)
+    parser_history_member.set_defaults(handler=command_history_member)
+    parser_history_distance = history_subparsers.add_parser("distance")
+    parser_history_distance.add_argument("source_id", type=int)
+    parser_history_distance.add_argument("target_id", type=int)
+    parser_history_distance.add_argument(
+        "--at", help="build time (default: the latest)"
+    )
+    parser_history_distance.set_defaults(handler=command_history_distance)
+
     parser_serve = subparsers.add_parser("serve")
     parser_serve.add_argument("--bind", nargs="*", default=[":8471"])
+    parser_serve.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, all sharing one mapped graph snapshot",
+    )
     parser_serve.set_defaults(handler=command_serve)
 
     args = parser.parse_args()
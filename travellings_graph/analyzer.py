@@ -3,13 +3,17 @@ import datetime
 import json
 import os
 import sys
-from typing import Generator
-import networkx as nx
+from typing import Any, Callable, Generator
 from travellings_graph.domain_utils import strip_host
+from travellings_graph.graph_export import GraphExporter, commit_exports, open_exporters
+from travellings_graph.build_compare import compare_with_build
+from travellings_graph.history import BuildHistory, find_build
 from travellings_graph.member_list import MemberRecord, read_members
+from travellings_graph.reachability import ReachabilityBuilder
+from travellings_graph.snapshot import write_graph_snapshot
 
 
-@dataclass
+@dataclass(slots=True)
 class ConnectionAnalysis:
     id: int
     connection_count: int
@@ -23,12 +27,33 @@ def read_links_data() -> Generator[dict, None, None]:
             yield json.loads(line)
 
 
-def build_graph(members: list[MemberRecord], member_map: dict[str, MemberRecord]) -> nx.DiGraph:
-    graph = nx.DiGraph()
-    for member in members:
-        graph.add_node(member.id, name=member.name)
+def build_graph(
+    members: list[MemberRecord],
+    member_map: dict[str, MemberRecord],
+    exporters: list[GraphExporter],
+) -> list[dict[int, None]]:
+    # the successors of each member by index, in the order the links are found;
+    # every new edge is streamed to the exporters as soon as it is found
+    index_of = {member.id: index for index, member in enumerate(members)}
+    successors: list[dict[int, None]] = [{} for _ in members]
+    for exporter in exporters:
+        exporter.begin([(member.id, member.name) for member in members])
+
+    def add_edge(source_id: int, target_id: int):
+        source = index_of[source_id]
+        target = index_of[target_id]
+        if target in successors[source]:
+            return
+        successors[source][target] = None
+        for exporter in exporters:
+            exporter.edge(source_id, target_id)
+
     for record in read_links_data():
         if record["kind"] == "friends_link":
+            if "target_id" in record:  # already resolved while crawling
+                if record["source_id"] in index_of and record["target_id"] in index_of:
+                    add_edge(record["source_id"], record["target_id"])
+                continue
             source = strip_host(record["start"])
             target = strip_host(record["target"])
             if source == target:
@@ -36,14 +61,27 @@ def build_graph(members: list[MemberRecord], member_map: dict[str, MemberRecord]
             if source in member_map and target in member_map:
                 source_member = member_map[source]
                 target_member = member_map[target]
-                graph.add_edge(source_member.id, target_member.id)
-    return graph
+                add_edge(source_member.id, target_member.id)
+    for exporter in exporters:
+        exporter.close()
+    return successors
+
+
+def reverse_graph(successors: list[dict[int, None]]) -> list[dict[int, None]]:
+    predecessors: list[dict[int, None]] = [{} for _ in successors]
+    for source, targets in enumerate(successors):
+        for target in targets:
+            predecessors[target][source] = None
+    return predecessors
 
 
 def build_links_page_map(member_map: dict[str, MemberRecord]) -> dict[int, str]:
     page_map = {}
     for record in read_links_data():
         if record["kind"] == "friends_page":
+            if "source_id" in record:  # already resolved while crawling
+                page_map[record["source_id"]] = record["target"]
+                continue
             host = strip_host(record["start"])
             if host in member_map:
                 member = member_map[host]
@@ -51,82 +89,127 @@ def build_links_page_map(member_map: dict[str, MemberRecord]) -> dict[int, str]:
     return page_map
 
 
-def analyze_connection(graph: nx.DiGraph) -> Generator[ConnectionAnalysis, None, None]:
-    paths = nx.all_pairs_shortest_path_length(graph)
-    for target, sources in paths:
-        if len(sources) == 1:
+def bfs_levels(adjacency: list[dict[int, None]], source: int) -> list[list[int]]:
+    # the nodes at each distance from source, starting with [source] at distance 0
+    visited = bytearray(len(adjacency))
+    visited[source] = 1
+    levels = [[source]]
+    while True:
+        level = []
+        for node in levels[-1]:
+            for neighbor in adjacency[node]:
+                if not visited[neighbor]:
+                    visited[neighbor] = 1
+                    level.append(neighbor)
+        if len(level) == 0:
+            return levels
+        levels.append(level)
+
+
+def analyze_connection(
+    ids: list[int],
+    adjacency: list[dict[int, None]],
+    on_levels: Callable[[int, list[list[int]]], None] | None = None,
+) -> Generator[ConnectionAnalysis, None, None]:
+    for index, node_id in enumerate(ids):
+        levels = bfs_levels(adjacency, index)
+        if on_levels is not None:
+            on_levels(index, levels)
+        if len(levels) == 1:
             yield ConnectionAnalysis(
-                id=target,
+                id=node_id,
                 connection_count=0,
                 avg_distance=0,
             )
             continue
-        connected_edges = len(sources) - 1
-        avg_distance = sum(sources.values()) / connected_edges
-        connection_in6degrees = (
-            sum(map(lambda x: 1 if x <= 6 else 0, sources.values())) - 1
+        connected_edges = sum(len(level) for level in levels[1:])
+        avg_distance = (
+            sum(distance * len(level) for distance, level in enumerate(levels))
+            / connected_edges
         )
+        connection_in6degrees = sum(len(level) for level in levels[1:7])
         yield ConnectionAnalysis(
-            id=target,
+            id=node_id,
             connection_count=connected_edges,
             avg_distance=avg_distance,
             connection_in6degrees=connection_in6degrees,
         )
 
 
-def run_analyzer():
-    if not os.path.exists("friends.lines.json"):
-        print("Friends Info is not crawled yet, please run with `crawl` first")
-        sys.exit(1)
-
-    members = read_members()
-    member_domain_map = {strip_host(member.url): member for member in members}
-
-    graph = build_graph(members, member_domain_map)
-    nx.write_gexf(graph, "graph.gexf")
-
-    links_page_map = build_links_page_map(member_domain_map)
+def analyze_graph(
+    members: list[MemberRecord], successors: list[dict[int, None]]
+) -> tuple[list[ConnectionAnalysis], list[ConnectionAnalysis], ReachabilityBuilder]:
+    # the distances are only walked once, so the reachability index is filled along the way
+    ids = [member.id for member in members]
+    reachability = ReachabilityBuilder(ids)
+    # by member index, like the adjacency lists
+    outgoing_connections = list(
+        analyze_connection(
+            ids,
+            successors,
+            lambda index, levels: reachability.add("out", index, levels),
+        )
+    )
+    incoming_connections = list(
+        analyze_connection(
+            ids,
+            reverse_graph(successors),
+            lambda index, levels: reachability.add("in", index, levels),
+        )
+    )
+    return outgoing_connections, incoming_connections, reachability
 
-    outgoing_connections = {
-        connection.id: connection for connection in analyze_connection(graph)
-    }
-    incoming_connections = {
-        connection.id: connection for connection in analyze_connection(graph.reverse())
-    }
 
+def write_analysis_csv(
+    members: list[MemberRecord],
+    outgoing_connections: list[ConnectionAnalysis],
+    incoming_connections: list[ConnectionAnalysis],
+    links_page_map: dict[int, str],
+):
     with open("analysis.csv", "w", encoding="utf-8") as f:
-        f.write("ID,Name,URL,Links," +
-                "OutgoingCount,OutgoingCountIn6Degrees,OutgoingAverage," + 
-                "IncomingCount,IncomingCountIn6Degrees,IncomingAverage\n")
-        for member in members:
-            outgoing = outgoing_connections[member.id]
-            incoming = incoming_connections[member.id]
+        f.write(
+            "ID,Name,URL,Links,"
+            + "OutgoingCount,OutgoingCountIn6Degrees,OutgoingAverage,"
+            + "IncomingCount,IncomingCountIn6Degrees,IncomingAverage\n"
+        )
+        for index, member in enumerate(members):
+            outgoing = outgoing_connections[index]
+            incoming = incoming_connections[index]
             links_page = links_page_map.get(member.id, "")
             f.write(
-                f"{member.id},\"{member.name}\",\"{member.url}\"," +
-                f"\"{links_page}\"," +
-                f"{outgoing.connection_count}," +
-                f"{outgoing.connection_in6degrees}," +
-                f"{outgoing.avg_distance:.4f}," +
-                f"{incoming.connection_count}," +
-                f"{incoming.connection_in6degrees}," +
-                f"{incoming.avg_distance:.4f}\n"
+                f'{member.id},"{member.name}","{member.url}",'
+                + f'"{links_page}",'
+                + f"{outgoing.connection_count},"
+                + f"{outgoing.connection_in6degrees},"
+                + f"{outgoing.avg_distance:.4f},"
+                + f"{incoming.connection_count},"
+                + f"{incoming.connection_in6degrees},"
+                + f"{incoming.avg_distance:.4f}\n"
             )
 
 
+def write_analysis_markdown(
+    members: list[MemberRecord],
+    connection_count: int,
+    outgoing_connections: list[ConnectionAnalysis],
+    incoming_connections: list[ConnectionAnalysis],
+    links_page_map: dict[int, str],
+):
     with open("analysis.md", "w", encoding="utf-8") as f:
         f.write("# Connection Analysis\n")
         f.write(
-            f"Build Date: {datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")}  \n"
+            "Build Date: "
+            + datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+            + "  \n"
         )
         f.write(f"Total members: {len(members)}  \n")
-        f.write(f"Total connections: {len(graph.edges)}  \n")
+        f.write(f"Total connections: {connection_count}  \n")
         f.write(
-            f"Average connections per member: {len(graph.edges) / len(members)}  \n"
+            f"Average connections per member: {connection_count / len(members)}  \n"
         )
-        for member in members:
-            outgoing = outgoing_connections[member.id]
-            incoming = incoming_connections[member.id]
+        for index, member in enumerate(members):
+            outgoing = outgoing_connections[index]
+            incoming = incoming_connections[index]
             links_page = links_page_map.get(member.id, "")
             f.write(f"## [{member.name}]({member.url}) \\(Member #{member.id}\\)\n")
             if len(links_page):
@@ -142,17 +225,85 @@ def run_analyzer():
             f.write(f" ({incoming.connection_in6degrees} in 6 degrees)  \n")
             f.write(f"Average distance: {incoming.avg_distance:.4f}  \n")
 
+
+def write_build_info(member_count: int, connection_count: int) -> dict[str, Any]:
+    build_info = {
+        "members": member_count,
+        "connections": connection_count,
+        "average_connections": connection_count / member_count,
+        "build_time": datetime.datetime.now(datetime.UTC).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        ),
+    }
     with open("build-info.json", "w", encoding="utf-8") as f:
-        json.dump(
-            {
-                "members": len(members),
-                "connections": len(graph.edges),
-                "average_connections": len(graph.edges) / len(members),
-                "build_time": datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
-            },
-            f,
-            indent=2,
+        json.dump(build_info, f, indent=2)
+    return build_info
+
+
+def run_analyzer(export_formats: list[str] | None = None, compare: str | None = None):
+    if not os.path.exists("friends.lines.json"):
+        print("Friends Info is not crawled yet, please run with `crawl` first")
+        sys.exit(1)
+
+    history = BuildHistory()
+    compare_position = None
+    if compare is not None:
+        compare_position = find_build(
+            history, None if compare == "previous" else compare
         )
 
+    members = read_members()
+    member_domain_map = {strip_host(member.url): member for member in members}
+
+    exporters = open_exporters(
+        export_formats if export_formats is not None else ["gexf"]
+    )
+    successors = build_graph(members, member_domain_map, exporters)
+    edges = [
+        (members[source].id, members[target].id)
+        for source, targets in enumerate(successors)
+        for target in targets
+    ]
+
+    links_page_map = build_links_page_map(member_domain_map)
+    outgoing_connections, incoming_connections, reachability = analyze_graph(
+        members, successors
+    )
+    write_analysis_csv(
+        members, outgoing_connections, incoming_connections, links_page_map
+    )
+    write_analysis_markdown(
+        members, len(edges), outgoing_connections, incoming_connections, links_page_map
+    )
+
+    build_info = write_build_info(len(members), len(edges))
+
+    # binary snapshot for the server, with the same values as analysis.csv
+    items = [
+        {
+            "id": member.id,
+            "name": member.name,
+            "url": member.url,
+            "links": links_page_map.get(member.id, ""),
+            "outgoing_count": outgoing.connection_count,
+            "outgoing_count_in6degrees": outgoing.connection_in6degrees,
+            "outgoing_average_distance": round(outgoing.avg_distance, 4),
+            "incoming_count": incoming.connection_count,
+            "incoming_count_in6degrees": incoming.connection_in6degrees,
+            "incoming_average_distance": round(incoming.avg_distance, 4),
+        }
+        for member, outgoing, incoming in zip(
+            members, outgoing_connections, incoming_connections
+        )
+    ]
+    # the sources of the snapshot, so they must not be newer than it
+    commit_exports(exporters)
+    write_graph_snapshot("graph.snapshot", build_info, items, edges)
+    reachability.write("reachability.bin")
+    if compare_position is not None:
+        compare_with_build(history, compare_position, members, items, edges)
+    history.record(build_info, items, edges)
+
+
 if __name__ == "__main__":
     run_analyzer()
@@ -0,0 +1,293 @@
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import IO, Any
+from travellings_graph.history import BuildHistory, edge_of_key
+from travellings_graph.member_list import MemberRecord
+from travellings_graph.snapshot import ANALYSIS_FLOAT_COLUMNS, ANALYSIS_INT_COLUMNS
+
+COMPARE_COLUMNS = ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS
+COMPARE_TOP_EDGES = 20
+COMPARE_TOP_MEMBERS = 10
+# the successors and the predecessors of each member
+Adjacency = tuple[dict[int, list[int]], dict[int, list[int]]]
+
+
+@dataclass(slots=True)
+class MemberDelta:
+    id: int
+    change: str  # "added", "removed" or "changed"
+    deltas: dict[str, float]
+
+    @property
+    def magnitude(self) -> float:
+        return abs(self.deltas["outgoing_count_in6degrees"]) + abs(
+            self.deltas["incoming_count_in6degrees"]
+        )
+
+
+@dataclass(slots=True)
+class EdgeAttribution:
+    source: int
+    target: int
+    added: bool
+    score: float = 0
+    affected_sources: int = 0
+    affected_targets: int = 0
+
+
+def adjacency_of(edges: list[tuple[int, int]]) -> Adjacency:
+    successors: dict[int, list[int]] = {}
+    predecessors: dict[int, list[int]] = {}
+    for source, target in edges:
+        successors.setdefault(source, []).append(target)
+        predecessors.setdefault(target, []).append(source)
+    return successors, predecessors
+
+
+def distances_from(adjacency: dict[int, list[int]], start: int) -> dict[int, int]:
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for neighbor in adjacency.get(node, []):
+            if neighbor not in distances:
+                distances[neighbor] = distances[node] + 1
+                queue.append(neighbor)
+    return distances
+
+
+def member_deltas(
+    previous: dict[int, dict[str, Any]], current: dict[int, dict[str, Any]]
+) -> list[MemberDelta]:
+    zero = {column: 0 for column in COMPARE_COLUMNS}
+    result = []
+    for member_id in sorted(previous.keys() | current.keys()):
+        before = previous.get(member_id, zero)
+        after = current.get(member_id, zero)
+        deltas = {
+            column: (
+                round(after[column] - before[column], 4)
+                if column in ANALYSIS_FLOAT_COLUMNS
+                else after[column] - before[column]
+            )
+            for column in COMPARE_COLUMNS
+        }
+        if member_id not in previous:
+            result.append(MemberDelta(member_id, "added", deltas))
+        elif member_id not in current:
+            result.append(MemberDelta(member_id, "removed", deltas))
+        elif any(deltas.values()):
+            result.append(MemberDelta(member_id, "changed", deltas))
+    return result
+
+
+def distances_along(graph: Adjacency, upstream: bool, node: int) -> dict[int, int]:
+    # from node, or to node if upstream
+    successors, predecessors = graph
+    return distances_from(predecessors if upstream else successors, node)
+
+
+def affected_by(
+    is_added: bool,
+    near_distances: dict[int, int],
+    old_far: dict[int, int],
+    new_far: dict[int, int],
+) -> set[int]:
+    # near_distances are from the endpoint closer to the affected members (u for sources,
+    # v for targets), in the graph which has the edge
+    if is_added:
+        return {
+            member_id
+            for member_id, distance in near_distances.items()
+            if distance + 1 < old_far.get(member_id, math.inf)
+        }
+    return {
+        member_id
+        for member_id, distance in near_distances.items()
+        if old_far.get(member_id) == distance + 1 < new_far.get(member_id, math.inf)
+    }
+
+
+def affected_members(
+    changes: list[tuple[int, int, bool]],
+    previous_graph: Adjacency,
+    current_graph: Adjacency,
+    upstream: bool,
+) -> list[set[int]]:
+    # The affected sources of each change if upstream, found upstream of u with v as the
+    # far endpoint, otherwise its affected targets, found downstream of v.
+    # The changes are grouped by their far endpoint, so only the distances of one group
+    # are kept at a time.
+    far_end = 1 if upstream else 0
+    groups: dict[int, list[int]] = {}
+    for position, change in enumerate(changes):
+        groups.setdefault(change[far_end], []).append(position)
+    affected: list[set[int]] = [set() for _ in changes]
+    for far, positions in groups.items():
+        old_far = distances_along(previous_graph, upstream, far)
+        # only removed edges need the new distances
+        new_far = (
+            distances_along(current_graph, upstream, far)
+            if any(not changes[position][2] for position in positions)
+            else {}
+        )
+        for position in positions:
+            is_added = changes[position][2]
+            near = changes[position][1 - far_end]
+            affected[position] = affected_by(
+                is_added,
+                distances_along(
+                    current_graph if is_added else previous_graph, upstream, near
+                ),
+                old_far,
+                new_far,
+            )
+    return affected
+
+
+def score_attributions(
+    attributions: list[EdgeAttribution],
+    sources_of: list[set[int]],
+    targets_of: list[set[int]],
+    deltas: list[MemberDelta],
+):
+    # each member's change is split between the edges whose sets contain it
+    outgoing_change = {
+        delta.id: abs(delta.deltas["outgoing_count"])
+        + abs(delta.deltas["outgoing_count_in6degrees"])
+        for delta in deltas
+    }
+    incoming_change = {
+        delta.id: abs(delta.deltas["incoming_count"])
+        + abs(delta.deltas["incoming_count_in6degrees"])
+        for delta in deltas
+    }
+    outgoing_share: dict[int, int] = {}
+    incoming_share: dict[int, int] = {}
+    for sources, targets in zip(sources_of, targets_of):
+        for member_id in sources:
+            outgoing_share[member_id] = outgoing_share.get(member_id, 0) + 1
+        for member_id in targets:
+            incoming_share[member_id] = incoming_share.get(member_id, 0) + 1
+
+    for attribution, sources, targets in zip(attributions, sources_of, targets_of):
+        attribution.affected_sources = len(sources)
+        attribution.affected_targets = len(targets)
+        attribution.score = sum(
+            outgoing_change.get(member_id, 0) / outgoing_share[member_id]
+            for member_id in sources
+        ) + sum(
+            incoming_change.get(member_id, 0) / incoming_share[member_id]
+            for member_id in targets
+        )
+
+
+def attribute_edges(
+    previous_edges: list[tuple[int, int]],
+    current_edges: list[tuple[int, int]],
+    added: list[tuple[int, int]],
+    removed: list[tuple[int, int]],
+    deltas: list[MemberDelta],
+) -> list[EdgeAttribution]:
+    # The affected sources of an edge u -> v are the members whose distance to v it changes:
+    # - added: the edge gives a strictly shorter path, d_new(s, u) + 1 < d_old(s, v)
+    # - removed: the edge was on a shortest path, d_old(s, u) + 1 == d_old(s, v) < d_new(s, v)
+    # and its affected targets are the members whose distance from u it changes, likewise.
+    # Each takes a BFS from the edge's endpoints instead of a second all-pairs BFS.
+    previous_graph = adjacency_of(previous_edges)
+    current_graph = adjacency_of(current_edges)
+    changes = [(source, target, True) for source, target in added] + [
+        (source, target, False) for source, target in removed
+    ]
+    attributions = [
+        EdgeAttribution(source, target, is_added)
+        for source, target, is_added in changes
+    ]
+    sources_of = affected_members(changes, previous_graph, current_graph, upstream=True)
+    targets_of = affected_members(
+        changes, previous_graph, current_graph, upstream=False
+    )
+    score_attributions(attributions, sources_of, targets_of, deltas)
+    attributions.sort(key=lambda attribution: attribution.score, reverse=True)
+    return attributions
+
+
+def write_diff_csv(deltas: list[MemberDelta], names: dict[int, str]):
+    with open("analysis-diff.csv", "w", encoding="utf-8") as f:
+        f.write(
+            "ID,Name,Change,"
+            + "OutgoingCountDelta,OutgoingCountIn6DegreesDelta,OutgoingAverageDelta,"
+            + "IncomingCountDelta,IncomingCountIn6DegreesDelta,IncomingAverageDelta\n"
+        )
+        for delta in deltas:
+            values = delta.deltas
+            f.write(
+                f"{delta.id},\"{names.get(delta.id, '')}\",{delta.change},"
+                + f"{values['outgoing_count']},"
+                + f"{values['outgoing_count_in6degrees']},"
+                + f"{values['outgoing_average_distance']:.4f},"
+                + f"{values['incoming_count']},"
+                + f"{values['incoming_count_in6degrees']},"
+                + f"{values['incoming_average_distance']:.4f}\n"
+            )
+
+
+def write_largest_changes(f: IO[str], deltas: list[MemberDelta], names: dict[int, str]):
+    f.write("## Largest Changes\n")
+    largest = sorted(deltas, key=lambda delta: delta.magnitude, reverse=True)
+    for delta in largest[:COMPARE_TOP_MEMBERS]:
+        if delta.magnitude == 0:
+            break
+        f.write(
+            f"- {names.get(delta.id, '')} \\(Member #{delta.id}, {delta.change}\\): "
+            + f"{delta.deltas['outgoing_count_in6degrees']:+d} outgoing in 6 degrees, "
+            + f"{delta.deltas['incoming_count_in6degrees']:+d} incoming in 6 degrees  \n"
+        )
+
+
+def write_responsible_connections(f: IO[str], attributions: list[EdgeAttribution]):
+    f.write("## Responsible Connections\n")
+    for attribution in attributions[:COMPARE_TOP_EDGES]:
+        if attribution.score == 0:
+            break
+        f.write(
+            f"- {'Added' if attribution.added else 'Removed'} "
+            + f"#{attribution.source} \\-> #{attribution.target}: "
+            + f"{'shortens' if attribution.added else 'lengthens'} paths "
+            + f"from {attribution.affected_sources} members "
+            + f"and to {attribution.affected_targets} members "
+            + f"(score {attribution.score:.2f})  \n"
+        )
+
+
+def compare_with_build(
+    history: BuildHistory,
+    position: int,
+    members: list[MemberRecord],
+    items: list[dict[str, Any]],
+    edges: list[tuple[int, int]],
+):
+    # writes analysis-diff.csv, and appends the summary of the changes to analysis.md
+    previous_build = history.builds[position]
+    previous_edges = [edge_of_key(key) for key in sorted(history.edges_at(position))]
+    added = sorted(set(edges) - set(previous_edges))
+    removed = sorted(set(previous_edges) - set(edges))
+
+    deltas = member_deltas(
+        history.all_metrics(position), {item["id"]: item for item in items}
+    )
+    attributions = attribute_edges(previous_edges, edges, added, removed, deltas)
+    names = {member.id: member.name for member in members}
+    write_diff_csv(deltas, names)
+
+    with open("analysis.md", "a", encoding="utf-8") as f:
+        f.write(f"# Changes since {previous_build['build_time']}\n")
+        f.write(f"Connections: {len(added)} added, {len(removed)} removed  \n")
+        f.write(
+            f"Members: {sum(1 for delta in deltas if delta.change == 'added')} added, "
+            + f"{sum(1 for delta in deltas if delta.change == 'removed')} removed, "
+            + f"{sum(1 for delta in deltas if delta.change == 'changed')} changed  \n"
+        )
+        write_largest_changes(f, deltas, names)
+        write_responsible_connections(f, attributions)
@@ -0,0 +1,179 @@
+import json
+import logging
+import time
+from dataclasses import dataclass
+import scrapy
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import IgnoreRequest, StopDownload
+from scrapy.http import Headers, Response
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED_CONTENT_TYPES = [b"text/html", b"application/json", b"application/xhtml+xml"]
+# the bytes received for a request so far,
+# kept in its meta so that a redirect or retry starts over
+REQUEST_BYTES_META = "crawl_budget_bytes"
+
+
+@dataclass(slots=True)
+class MemberCrawlStats:
+    requests: int = 0
+    errors: int = 0
+    bytes: int = 0
+    first_seen: float = 0
+    last_seen: float = 0
+    over_budget: bool = False
+
+    @property
+    def seconds(self) -> float:
+        return self.last_seen - self.first_seen
+
+
+# Downloader middleware keeping a few slow or huge sites from dominating the crawl:
+# - stops a download once it exceeds the per-request byte budget
+#   (the truncated page is still parsed),
+#   or as soon as the headers show it is not a page at all
+# - ignores the remaining requests of a member once it exceeds the per-member budget
+# - backs off the download slot on errors
+#   (AutoThrottle only adapts to the latency of responses)
+# - records the time and bytes spent on each member
+class CrawlBudgetMiddleware:
+    def __init__(self, crawler: Crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.request_maxsize = settings.getint("CRAWL_REQUEST_MAXSIZE", 2 * 1024 * 1024)
+        self.member_maxsize = settings.getint("CRAWL_MEMBER_MAXSIZE", 8 * 1024 * 1024)
+        self.stats_path = settings.get("CRAWL_STATS_PATH", "crawl-stats.json")
+        self.start_delay = settings.getfloat("AUTOTHROTTLE_START_DELAY", 1.0)
+        self.max_delay = settings.getfloat("AUTOTHROTTLE_MAX_DELAY", 60.0)
+        self.members: dict[str, MemberCrawlStats] = {}
+        crawler.signals.connect(
+            self.request_scheduled, signal=signals.request_scheduled
+        )
+        crawler.signals.connect(self.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(self.bytes_received, signal=signals.bytes_received)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler)
+
+    def member_of(self, request: scrapy.Request) -> MemberCrawlStats | None:
+        start = request.cb_kwargs.get("start")
+        if start is None:
+            return None
+        member = self.members.get(start)
+        if member is None:
+            member = MemberCrawlStats(first_seen=time.monotonic())
+            self.members[start] = member
+        member.last_seen = time.monotonic()
+        return member
+
+    # signal handlers only get the arguments they name,
+    # while Scrapy calls the middleware hooks below by keyword
+    def request_scheduled(self, request: scrapy.Request):
+        self.member_of(request)
+
+    def headers_received(self, headers: Headers):
+        content_type = headers.get("Content-Type")
+        if content_type is not None and not any(
+            content_type.startswith(accepted) for accepted in ACCEPTED_CONTENT_TYPES
+        ):
+            raise StopDownload(fail=False)
+
+    def bytes_received(self, data: bytes, request: scrapy.Request):
+        received = request.meta.get(REQUEST_BYTES_META, 0) + len(data)
+        request.meta[REQUEST_BYTES_META] = received
+        member = self.member_of(request)
+        if member is not None:
+            member.bytes += len(data)
+            if member.bytes > self.member_maxsize:
+                member.over_budget = True
+        if received > self.request_maxsize or (
+            member is not None and member.over_budget
+        ):
+            raise StopDownload(fail=False)
+
+    def process_request(
+        self, request: scrapy.Request, spider: scrapy.Spider
+    ):  # pylint: disable=unused-argument
+        request.meta[REQUEST_BYTES_META] = 0
+        member = self.member_of(request)
+        if member is None:
+            return None
+        if member.over_budget:
+            raise IgnoreRequest(
+                f"Byte budget of {request.cb_kwargs['start']} is exhausted"
+            )
+        member.requests += 1
+        return None
+
+    def process_response(
+        self, request: scrapy.Request, response: Response, spider: scrapy.Spider
+    ):  # pylint: disable=unused-argument
+        self.member_of(request)
+        if response.status >= 500 or response.status == 429:
+            self.back_off(request)
+        return response
+
+    def process_exception(
+        self, request: scrapy.Request, exception: Exception, spider: scrapy.Spider
+    ):  # pylint: disable=unused-argument
+        member = self.member_of(request)
+        if member is not None:
+            member.errors += 1
+        if not isinstance(exception, IgnoreRequest):
+            self.back_off(request)
+
+    def back_off(self, request: scrapy.Request):
+        engine = self.crawler.engine
+        if engine is None:
+            return
+        slot_key = request.meta.get("download_slot")
+        if slot_key is None:
+            return
+        slot = engine.downloader.slots.get(slot_key)
+        if slot is None:
+            return
+        slot.delay = min(self.max_delay, max(slot.delay * 2, self.start_delay))
+
+    def spider_closed(self):
+        stats = self.crawler.stats
+        if stats is not None:
+            stats.set_value(
+                "crawl_budget/bytes", sum(m.bytes for m in self.members.values())
+            )
+            stats.set_value(
+                "crawl_budget/over_budget_members",
+                sum(1 for m in self.members.values() if m.over_budget),
+            )
+
+        with open(self.stats_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    start: {
+                        "seconds": round(member.seconds, 3),
+                        "bytes": member.bytes,
+                        "requests": member.requests,
+                        "errors": member.errors,
+                        "over_budget": member.over_budget,
+                    }
+                    for start, member in sorted(
+                        self.members.items(), key=lambda x: x[1].seconds, reverse=True
+                    )
+                },
+                f,
+                indent=2,
+            )
+
+        slowest = sorted(self.members.items(), key=lambda x: x[1].seconds, reverse=True)
+        for start, member in slowest[:10]:
+            logger.info(
+                "Member %s: %.1fs, %d bytes, %d requests, %d errors",
+                start,
+                member.seconds,
+                member.bytes,
+                member.requests,
+                member.errors,
+            )
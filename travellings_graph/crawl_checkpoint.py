@@ -0,0 +1,234 @@
+import datetime
+import gzip
+import itertools
+import json
+import os
+import shutil
+import zlib
+from typing import IO, Any, Iterable
+import scrapy
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.http import Response
+from travellings_graph.crawl_shard import read_records
+
+CHECKPOINT_TOKEN_META = "checkpoint_token"
+
+
+# Keeps a crawl resumable at member granularity:
+# every item is appended to the output with a single write and flushed at once,
+# and a member is recorded as completed once all of its requests are done.
+# A request yielded by the spider gets a token in its meta; the redirected or retried
+# requests made from it carry the same token, so they are counted as that one request.
+# On restart, the output (and the side file of external links, if kept) is cut back
+# to the completed members, and only the other members are crawled again.
+# A side file which is not kept in step with the output is moved aside.
+class CrawlCheckpoint:  # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        output_path: str = "friends.lines.json",
+        state_dir: str = "crawl-state",
+        external_path: str = "friends.external.lines.json.gz",
+        keep_external: bool = False,
+    ):
+        self.output_path = output_path
+        self.state_dir = state_dir
+        self.external_path = external_path
+        self.keep_external = keep_external
+        self.completed: set[str] = set()
+        self.pending: dict[str, set[int]] = {}
+        self.tokens = itertools.count()
+        self.output = None
+        self.external: IO | None = None
+        self.completed_file = None
+
+    @property
+    def completed_path(self) -> str:
+        return os.path.join(self.state_dir, "completed.lines.json")
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.state_dir)
+
+    def discard(self):
+        if self.exists():
+            shutil.rmtree(self.state_dir)
+
+    def open(self):
+        if self.exists():
+            self.completed = self.read_completed()
+            self.truncate_output()
+            if self.keep_external:
+                self.truncate_external()
+            stale_paths = [] if self.keep_external else [self.external_path]
+        else:
+            stale_paths = [self.output_path, self.external_path]
+            os.makedirs(self.state_dir)
+        bak_time = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%SZ")
+        for path in stale_paths:
+            if os.path.exists(path):
+                os.rename(path, f"{path}.bak.{bak_time}")
+        # the files stay open until close()
+        # pylint: disable=consider-using-with
+        self.output = open(self.output_path, "a", encoding="utf-8")
+        if self.keep_external:
+            # appended as a new gzip member, after the ones kept by truncate_external
+            self.external = gzip.open(self.external_path, "at", encoding="utf-8")
+        self.completed_file = open(self.completed_path, "a", encoding="utf-8")
+
+    def close(self, finished: bool):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+        if self.external is not None:
+            self.external.close()
+            self.external = None
+        if self.completed_file is not None:
+            self.completed_file.close()
+            self.completed_file = None
+        if finished:
+            self.discard()
+
+    def read_completed(self) -> set[str]:
+        completed = set()
+        if not os.path.exists(self.completed_path):
+            return completed
+        with open(self.completed_path, "r", encoding="utf-8") as f:
+            while line := f.readline():
+                try:
+                    completed.add(json.loads(line)["start"])
+                except (ValueError, KeyError):
+                    # the last line may be cut off by a crash
+                    continue
+        return completed
+
+    def truncate_output(self):
+        # drop the records of members which were not completed before the crash
+        if not os.path.exists(self.output_path):
+            return
+        tmp_path = self.output_path + ".tmp"
+        with open(self.output_path, "r", encoding="utf-8") as src, open(
+            tmp_path, "w", encoding="utf-8"
+        ) as dst:
+            for line, record in read_records(src):
+                if record.get("start") in self.completed:
+                    dst.write(line)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, self.output_path)
+
+    def truncate_external(self):
+        # same as truncate_output, but a crash may also have cut the last gzip member short
+        if not os.path.exists(self.external_path):
+            return
+        tmp_path = self.external_path + ".tmp"
+        with gzip.open(self.external_path, "rt", encoding="utf-8") as src, gzip.open(
+            tmp_path, "wt", encoding="utf-8"
+        ) as dst:
+            try:
+                for line, record in read_records(src):
+                    if record.get("start") in self.completed:
+                        dst.write(line)
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                pass
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.external_path)
+
+    def write_item(self, item: dict[str, Any]):
+        if self.output is None:
+            raise RuntimeError("Checkpoint is not opened")
+        self.output.write(json.dumps(item) + "\n")
+        self.output.flush()
+
+    def write_external(self, item: dict[str, Any]):
+        # compressed in blocks, it is only flushed when a member is completed
+        if self.external is not None:
+            self.external.write(json.dumps(item) + "\n")
+
+    def request_started(self, request: scrapy.Request):
+        start = request.cb_kwargs.get("start")
+        if start is None or CHECKPOINT_TOKEN_META in request.meta:
+            # a redirect or retry of a request which is still pending
+            return
+        token = next(self.tokens)
+        request.meta[CHECKPOINT_TOKEN_META] = token
+        self.pending.setdefault(start, set()).add(token)
+
+    def request_finished(self, request: scrapy.Request):
+        start = request.cb_kwargs.get("start")
+        if start is None:
+            return
+        token = request.meta.get(CHECKPOINT_TOKEN_META)
+        tokens = self.pending.get(start)
+        if tokens is None or token not in tokens:
+            return
+        tokens.remove(token)
+        if not tokens:
+            del self.pending[start]
+            self.complete_member(start)
+
+    def complete_member(self, start: str):
+        if self.output is None or self.completed_file is None:
+            return
+        # make sure the items are on disk before claiming the member is done
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        if self.external is not None:
+            self.external.flush()
+            os.fsync(self.external.fileno())
+        self.completed_file.write(
+            json.dumps(
+                {
+                    "start": start,
+                    "time": datetime.datetime.now(datetime.UTC).strftime(
+                        "%Y-%m-%dT%H:%M:%SZ"
+                    ),
+                }
+            )
+            + "\n"
+        )
+        self.completed_file.flush()
+        os.fsync(self.completed_file.fileno())
+        self.completed.add(start)
+
+
+class CheckpointMiddleware:
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+        crawler.signals.connect(
+            self.request_scheduled, signal=signals.request_scheduled
+        )
+        crawler.signals.connect(self.request_dropped, signal=signals.request_dropped)
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler)
+
+    def request_scheduled(self, request: scrapy.Request, spider: scrapy.Spider):
+        checkpoint: CrawlCheckpoint | None = getattr(spider, "checkpoint", None)
+        if checkpoint is not None:
+            checkpoint.request_started(request)
+
+    def request_dropped(self, request: scrapy.Request, spider: scrapy.Spider):
+        checkpoint: CrawlCheckpoint | None = getattr(spider, "checkpoint", None)
+        if checkpoint is not None:
+            checkpoint.request_finished(request)
+
+    def process_spider_output(
+        self, response: Response, result: Iterable[Any], spider: scrapy.Spider
+    ):
+        try:
+            yield from result
+        finally:
+            # requests yielded by the callback have been scheduled by now
+            checkpoint: CrawlCheckpoint | None = getattr(spider, "checkpoint", None)
+            if checkpoint is not None and response.request is not None:
+                checkpoint.request_finished(response.request)
+
+
+class CheckpointPipeline:  # pylint: disable=too-few-public-methods
+    def process_item(self, item: Any, spider: scrapy.Spider):
+        checkpoint: CrawlCheckpoint | None = getattr(spider, "checkpoint", None)
+        if checkpoint is not None:
+            checkpoint.write_item(dict(item))
+        return item
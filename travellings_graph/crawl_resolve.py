@@ -0,0 +1,50 @@
+import logging
+from typing import Any
+import scrapy
+from scrapy.exceptions import DropItem
+from scrapy.logformatter import LogFormatter
+from travellings_graph.crawl_checkpoint import CrawlCheckpoint
+from travellings_graph.domain_utils import strip_host
+from travellings_graph.member_list import read_members
+
+
+# Resolves the links to member IDs while crawling, the same way the analyzer matches them,
+# so only the links between members are kept in the output.
+# Links to non-members go to the checkpoint's optional compressed side file instead.
+class MemberResolvePipeline:
+    def __init__(self):
+        self.host_index: dict[str, int] = {}
+
+    def open_spider(self, spider: scrapy.Spider):  # pylint: disable=unused-argument
+        # all members, not only the ones of this shard
+        self.host_index = {
+            strip_host(member.url): member.id for member in read_members()
+        }
+
+    def process_item(self, item: Any, spider: scrapy.Spider):
+        source = strip_host(item["start"])
+        source_id = self.host_index.get(source)
+        if source_id is not None:
+            item["source_id"] = source_id
+        if item["kind"] != "friends_link":
+            return item
+
+        target = strip_host(item["target"])
+        if target == source:
+            raise DropItem("Link to the member itself")
+        target_id = self.host_index.get(target)
+        if source_id is None or target_id is None:
+            checkpoint: CrawlCheckpoint | None = getattr(spider, "checkpoint", None)
+            if checkpoint is not None:
+                checkpoint.write_external(dict(item))
+            raise DropItem("Link to a non-member")
+        item["target_id"] = target_id
+        return item
+
+
+class QuietDropLogFormatter(LogFormatter):
+    # dropping non-member links is routine, don't log a warning for each of them
+    def dropped(self, item, exception, response, spider):
+        entry = super().dropped(item, exception, response, spider)
+        entry["level"] = logging.DEBUG
+        return entry
@@ -0,0 +1,169 @@
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import IO, Any, Iterator
+from travellings_graph.domain_utils import strip_host
+
+SHARD_OUTPUT_PATTERN = re.compile(r"^friends\.shard-(\d+)-of-(\d+)\.lines\.json$")
+
+
+def read_records(file: IO[str]) -> Iterator[tuple[str, dict[str, Any]]]:
+    # each line of a crawl output with its record, skipping a line cut off by a crash
+    while line := file.readline():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        yield line, record
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid shard `{spec}`, expected `i/N`")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard `{spec}`, expected 1 <= i <= N"
+        )
+    return index, count
+
+
+def shard_of_url(url: str, count: int) -> int:
+    # members sharing a host always land in the same shard, which keeps per-host politeness
+    # (Python's hash() is salted per process, so it cannot be used here)
+    digest = hashlib.blake2b(strip_host(url).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count + 1
+
+
+def shard_output_path(index: int, count: int) -> str:
+    return f"friends.shard-{index}-of-{count}.lines.json"
+
+
+def shard_state_dir(index: int, count: int) -> str:
+    return f"crawl-state.shard-{index}-of-{count}"
+
+
+def shard_stats_path(index: int, count: int) -> str:
+    return f"crawl-stats.shard-{index}-of-{count}.json"
+
+
+def shard_external_path(index: int, count: int) -> str:
+    return f"friends.external.shard-{index}-of-{count}.lines.json.gz"
+
+
+def shard_meta_path(index: int, count: int) -> str:
+    return f"friends.shard-{index}-of-{count}.meta.json"
+
+
+def read_shard_members_version(path: str) -> str | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("members_version")
+
+
+def pin_shard_members_version(index: int, count: int, version: str, resume: bool):
+    # Every shard partitions the member list on its own, so all shards of a crawl must see
+    # the same list, or a member may fall in no shard or in two.
+    # The version is recorded with the shard output, and checked on resume and by `merge`.
+    path = shard_meta_path(index, count)
+    pinned = read_shard_members_version(path)
+    if resume and pinned is not None and pinned != version:
+        print(
+            f"The member list changed since shard {index}/{count} started, "
+            + "please run it again with `crawl --fresh`"
+        )
+        sys.exit(1)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"members_version": version}, f, indent=2)
+
+
+def find_shard_outputs() -> list[str]:
+    return sorted(
+        path
+        for path in glob.glob("friends.shard-*-of-*.lines.json")
+        if SHARD_OUTPUT_PATTERN.match(os.path.basename(path))
+    )
+
+
+def check_shard_outputs(paths: list[str]):
+    # the shards must be the finished outputs of one crawl: all of its N shards,
+    # crawled from the same member list
+    counts = set()
+    indexes = set()
+    versions: dict[str | None, list[str]] = {}
+    for path in paths:
+        match = SHARD_OUTPUT_PATTERN.match(os.path.basename(path))
+        if match is None:
+            print(
+                f"{path} is not a shard output, expected friends.shard-i-of-N.lines.json"
+            )
+            sys.exit(1)
+        index, count = int(match.group(1)), int(match.group(2))
+        counts.add(count)
+        indexes.add(index)
+        state_dir = os.path.join(os.path.dirname(path), shard_state_dir(index, count))
+        if os.path.isdir(state_dir):
+            print(
+                f"Shard {index}/{count} is not finished yet, please resume its crawl first"
+            )
+            sys.exit(1)
+        version = read_shard_members_version(
+            os.path.join(os.path.dirname(path), shard_meta_path(index, count))
+        )
+        versions.setdefault(version, []).append(f"{index}/{count}")
+    if len(counts) > 1:
+        print(f"Shard outputs come from different shard counts: {sorted(counts)}")
+        sys.exit(1)
+    missing = set(range(1, counts.pop() + 1)) - indexes
+    if missing:
+        print(f"Missing shard outputs: {sorted(missing)}")
+        sys.exit(1)
+    if None in versions:
+        print(
+            f"Shards {', '.join(versions[None])} have no member list version, "
+            + "please crawl them again with `crawl --fresh`"
+        )
+        sys.exit(1)
+    if len(versions) > 1:
+        print(
+            "Shards were crawled from different member lists, please crawl them again:"
+        )
+        for version, shards in versions.items():
+            print(f"  {version}: {', '.join(shards)}")
+        sys.exit(1)
+
+
+def merge_shards(
+    paths: list[str] | None = None, output_path: str = "friends.lines.json"
+):
+    if not paths:
+        paths = find_shard_outputs()
+    if len(paths) == 0:
+        print("No shard output is found, please run with `crawl --shard i/N` first")
+        sys.exit(1)
+    check_shard_outputs(paths)
+
+    seen = set()
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as dst:
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as src:
+                for _, record in read_records(src):
+                    key = json.dumps(record, sort_keys=True)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    dst.write(json.dumps(record) + "\n")
+
+    if os.path.exists(output_path):
+        bak_time = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%SZ")
+        os.rename(output_path, f"{output_path}.bak.{bak_time}")
+    os.replace(tmp_path, output_path)
+    print(f"Merged {len(seen)} records from {len(paths)} shards into {output_path}")
@@ -1,14 +1,32 @@
-import datetime
+from abc import ABC, abstractmethod
 import re
 import json
 import os
-from typing import Any, Generator, Iterable
+from typing import Any, Iterable
 import scrapy
 from scrapy.crawler import CrawlerProcess
+from twisted.python.failure import Failure
 import urllib3
 import urllib3.util
+from travellings_graph.crawl_checkpoint import CrawlCheckpoint
+from travellings_graph.crawl_shard import (
+    pin_shard_members_version,
+    shard_of_url,
+    shard_external_path,
+    shard_output_path,
+    shard_state_dir,
+    shard_stats_path,
+)
 from travellings_graph.domain_utils import cross_domain, host_or_sub_in_list
-from travellings_graph.member_list import download_members, read_members
+from travellings_graph.member_list import (
+    DEAD_MEMBER_STATUSES,
+    MemberListDiff,
+    members_version,
+    read_members,
+    settle_pending_diff,
+    sync_members,
+    write_json_atomic,
+)
 
 FRIEND_LINKS_NAME_KEYWORDS = [
     "友情",
@@ -28,6 +46,7 @@ FRIEND_LINKS_URL_PREFIXS = [
     "/%e5%8f%8b%e4%ba%ba%e5%b8%90",  # /友人帐
 ]
 HOMEPAGE_CONTINUTE_KEYWORDS = ["博客", "blog"]
+BRUTE_FORCE_TIMEOUT = 10  # 猜测的子域名大多不存在，不必等待太久
 FRIEND_BOX_SELECTOR = [
     '*[itemprop="articleBody"]',  # https://schema.org/Article
     ".link-box",  # https://get233.com/archives/mirages-intro.html
@@ -85,21 +104,203 @@ def extract_url_from_elem(elem: scrapy.Selector):
         yield url_str
 
 
+class LinksAdapter(ABC):
+    # Detects a blog engine which exposes its links as structured data,
+    # so that they can be fetched directly instead of scraped from the themed page
+    name = ""
+
+    @abstractmethod
+    def detect(self, response) -> bool: ...
+
+    @abstractmethod
+    def api_url(self, response) -> str | None: ...
+
+    @abstractmethod
+    def extract_links(self, data: Any) -> list[str] | None: ...
+
+
+class MixSpaceAdapter(LinksAdapter):
+    name = "mix_space"
+    API_URL_PATTERNS = [
+        r"\"NEXT_PUBLIC_API_URL\"\s*:\s*\"([^\"]*)\"",
+        r"\\\"NEXT_PUBLIC_API_URL\\\"\s*:\s*\\\"([^\"]*)\\\"",
+        r'<meta\s+name="api_url"\s+content="([^\"]*)"\/?\s*>',
+    ]
+
+    def detect(self, response) -> bool:
+        return b"%c Mix Space %c https://github.com/mx-space" in response.body
+
+    def api_url(self, response) -> str | None:
+        body_str = response.body.decode("utf-8", errors="replace")
+        for pattern in self.API_URL_PATTERNS:
+            api_url = re.findall(pattern, body_str)
+            if len(api_url) == 0:
+                continue
+            return response.urljoin(api_url[0] + "/links/all")
+        return None
+
+    def extract_links(self, data: Any) -> list[str] | None:
+        if not isinstance(data, dict) or not isinstance(data.get("data"), list):
+            return None
+        return [
+            link["url"]
+            for link in data["data"]
+            if isinstance(link, dict) and isinstance(link.get("url"), str)
+        ]
+
+
+class HaloAdapter(LinksAdapter):
+    # https://github.com/halo-sigs/plugin-links
+    name = "halo"
+
+    def detect(self, response) -> bool:
+        return (
+            re.search(rb'<meta\s+name="generator"\s+content="Halo 2', response.body)
+            is not None
+        )
+
+    def api_url(self, response) -> str | None:
+        return response.urljoin(
+            "/apis/api.plugin.halo.run/v1alpha1/plugins/PluginLinks/links?size=1000"
+        )
+
+    def extract_links(self, data: Any) -> list[str] | None:
+        if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+            return None
+        return [
+            item["spec"]["url"]
+            for item in data["items"]
+            if isinstance(item, dict)
+            and isinstance(item.get("spec"), dict)
+            and isinstance(item["spec"].get("url"), str)
+        ]
+
+
+LINKS_ADAPTERS: list[LinksAdapter] = [
+    MixSpaceAdapter(),
+    HaloAdapter(),
+]
+LINKS_ADAPTERS_BY_NAME = {adapter.name: adapter for adapter in LINKS_ADAPTERS}
+
+
+class FingerprintCache:
+    # Remembers which adapter worked for each member, keyed by the member URL,
+    # so later crawls can go to the structured endpoint directly
+    def __init__(self, path: str = "fingerprints.json"):
+        self.path = path
+        self.entries = self.read()
+        self.changes: dict[str, dict[str, str] | None] = {}
+
+    def read(self) -> dict[str, dict[str, str]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def get(self, start: str) -> dict[str, str] | None:
+        entry = self.entries.get(start)
+        if entry is None or entry.get("engine") not in LINKS_ADAPTERS_BY_NAME:
+            return None
+        return entry
+
+    def remember(self, start: str, engine: str, api: str, page: str):
+        entry = {"engine": engine, "api": api, "page": page}
+        if self.entries.get(start) != entry:
+            self.entries[start] = entry
+            self.changes[start] = entry
+
+    def forget(self, start: str):
+        if start in self.entries:
+            del self.entries[start]
+            self.changes[start] = None
+
+    def save(self):
+        if len(self.changes) == 0:
+            return
+        # re-read first, other shards on this machine may share the file
+        entries = self.read()
+        for start, entry in self.changes.items():
+            if entry is None:
+                entries.pop(start, None)
+            else:
+                entries[start] = entry
+        write_json_atomic(self.path, entries)
+        self.changes.clear()
+
+
 class FriendSpider(scrapy.Spider):
     name = "FriendSpider"
     start_urls = []
 
-    def __init__(self):
+    def __init__(
+        self,
+        checkpoint: CrawlCheckpoint | None = None,
+        shard: tuple[int, int] | None = None,
+        member_diff: MemberListDiff | None = None,
+    ):
         super().__init__()
-        download_members()
-        self.members = read_members()
+        self.member_diff = member_diff if member_diff is not None else sync_members()
+        self.members = [
+            member
+            for member in read_members()
+            if member.status not in DEAD_MEMBER_STATUSES
+        ]
+        # new members and members whose URL or status changed are crawled first
+        changed = self.member_diff.changed_ids()
+        self.members.sort(key=lambda member: member.id not in changed)
+        if shard is not None:
+            index, count = shard
+            self.members = [
+                member
+                for member in self.members
+                if shard_of_url(member.url, count) == index
+            ]
+        self.checkpoint = checkpoint
+        self.fingerprints = FingerprintCache()
 
     def start_requests(self) -> Iterable[scrapy.Request]:
+        completed = self.checkpoint.completed if self.checkpoint is not None else set()
+        changed = self.member_diff.changed_ids()
         for member in self.members:
+            if member.url in completed:
+                continue
+            priority = 1 if member.id in changed else 0
+            fingerprint = self.fingerprints.get(member.url)
+            if fingerprint is not None:
+                yield scrapy.Request(
+                    fingerprint["api"],
+                    self.parse_links_api,
+                    dont_filter=True,
+                    priority=priority,
+                    cb_kwargs={
+                        "start": member.url,
+                        "adapter": fingerprint["engine"],
+                        "page": fingerprint["page"],
+                        "cached": True,
+                    },
+                    errback=self.on_links_api_error,
+                )
+                continue
             yield scrapy.Request(
-                member.url, dont_filter=True, cb_kwargs={"start": member.url}
+                member.url,
+                dont_filter=True,
+                priority=priority,
+                cb_kwargs={"start": member.url},
+                errback=self.on_request_error,
             )
 
+    def on_request_error(self, failure: Failure):
+        if self.checkpoint is not None:
+            self.checkpoint.request_finished(failure.request)  # type: ignore
+
+    def closed(self, reason: str):
+        self.fingerprints.save()
+        if self.checkpoint is not None:
+            self.checkpoint.close(finished=reason == "finished")
+
     def parse(self, response, **kwargs):
         yield from self.parse_homepage(response, **kwargs)
 
@@ -163,6 +364,7 @@ class FriendSpider(scrapy.Spider):
                                 url_str,
                                 self.parse_friends_page,
                                 cb_kwargs={"start": start_url},
+                                errback=self.on_request_error,
                             )
                             return
                 elif policy_stage == 1:  # if no url path matched, try to find by title
@@ -179,6 +381,7 @@ class FriendSpider(scrapy.Spider):
                                 url_str,
                                 self.parse_friends_page,
                                 cb_kwargs={"start": start_url},
+                                errback=self.on_request_error,
                             )
                             return
 
@@ -189,7 +392,10 @@ class FriendSpider(scrapy.Spider):
             if title_str is not None:
                 if any(keyword in title_str for keyword in HOMEPAGE_CONTINUTE_KEYWORDS):
                     yield response.follow(
-                        url_str, self.parse_homepage, cb_kwargs={"start": start_url}
+                        url_str,
+                        self.parse_homepage,
+                        cb_kwargs={"start": start_url},
+                        errback=self.on_request_error,
                     )
                     return
 
@@ -204,33 +410,45 @@ class FriendSpider(scrapy.Spider):
                     url_from.scheme + "://blog." + url_from.host[4:],
                     self.parse_homepage,
                     cb_kwargs={"start": start_url, "allow_brute_force": False},
+                    meta={"download_timeout": BRUTE_FORCE_TIMEOUT},
+                    errback=self.on_request_error,
                 )
                 yield response.follow(
                     url_from.scheme + "://" + url_from.host[4:],
                     self.parse_homepage,
                     cb_kwargs={"start": start_url, "allow_brute_force": False},
+                    meta={"download_timeout": BRUTE_FORCE_TIMEOUT},
+                    errback=self.on_request_error,
                 )
             elif url_from.host.startswith("blog."):
                 yield response.follow(
                     url_from.scheme + "://" + url_from.host[5:],
                     self.parse_homepage,
                     cb_kwargs={"start": start_url, "allow_brute_force": False},
+                    meta={"download_timeout": BRUTE_FORCE_TIMEOUT},
+                    errback=self.on_request_error,
                 )
                 yield response.follow(
                     url_from.scheme + "://www." + url_from.host[5:],
                     self.parse_homepage,
                     cb_kwargs={"start": start_url, "allow_brute_force": False},
+                    meta={"download_timeout": BRUTE_FORCE_TIMEOUT},
+                    errback=self.on_request_error,
                 )
             else:
                 yield response.follow(
                     url_from.scheme + "://blog." + url_from.host,
                     self.parse_homepage,
                     cb_kwargs={"start": start_url, "allow_brute_force": False},
+                    meta={"download_timeout": BRUTE_FORCE_TIMEOUT},
+                    errback=self.on_request_error,
                 )
                 yield response.follow(
                     url_from.scheme + "://www." + url_from.host,
                     self.parse_homepage,
                     cb_kwargs={"start": start_url, "allow_brute_force": False},
+                    meta={"download_timeout": BRUTE_FORCE_TIMEOUT},
+                    errback=self.on_request_error,
                 )
 
         if url_from.host is not None and url_from.scheme is not None:
@@ -239,31 +457,39 @@ class FriendSpider(scrapy.Spider):
                 url_from.scheme + "://" + url_from.host + "/links",
                 self.parse_friends_page,
                 cb_kwargs={"start": start_url, "allow_brute_force": False},
+                errback=self.on_request_error,
             )
             response.follow(
                 url_from.scheme + "://" + url_from.host + "/friends",
                 self.parse_friends_page,
                 cb_kwargs={"start": start_url, "allow_brute_force": False},
+                errback=self.on_request_error,
             )
 
         yield {"kind": "no_friends_page", "start": start_url, "from": response.url}
 
     def parse_friends_page(self, response, **kwargs):
         start_url = kwargs.get("start", response.url)
-        if b"%c Mix Space %c https://github.com/mx-space" in response.body:
-            yield {
-                "kind": "friends_page",
-                "start": start_url,
-                "target": response.url,
-            }
-            iterator = self.try_parse_friend_page_mix_space_index(response, **kwargs)
-            while True:
-                try:
-                    yield next(iterator)
-                except StopIteration as e:
-                    if e.value is True:
-                        return
-                    break
+        if response.status == 200 and response.headers.get(
+            "Content-Type", b""
+        ).startswith(b"text/html"):
+            for adapter in LINKS_ADAPTERS:
+                if not adapter.detect(response):
+                    continue
+                api_url = adapter.api_url(response)
+                if api_url is None:
+                    continue
+                yield response.follow(
+                    api_url,
+                    self.parse_links_api,
+                    cb_kwargs={
+                        "start": start_url,
+                        "adapter": adapter.name,
+                        "page": response.url,
+                    },
+                    errback=self.on_links_api_error,
+                )
+                return
 
         yield from self.parse_friends_page_generic(response, **kwargs)
 
@@ -338,55 +564,90 @@ class FriendSpider(scrapy.Spider):
                 "from": response.url,
             }
 
-    def try_parse_friend_page_mix_space_index(
-        self, response, **kwargs
-    ) -> Generator[Any, None, bool]:
-        patterns = [
-            r"\"NEXT_PUBLIC_API_URL\"\s*:\s*\"([^\"]*)\"",
-            r"\\\"NEXT_PUBLIC_API_URL\\\"\s*:\s*\\\"([^\"]*)\\\"",
-            r'<meta\s+name="api_url"\s+content="([^\"]*)"\/?\s*>',
-        ]
-        body_str = response.body.decode("utf-8")
-        start_url = kwargs.get("start", response.url)
-        for pattern in patterns:
-            api_url = re.findall(pattern, body_str)
-            if len(api_url) == 0:
-                continue
-            api_url = api_url[0]
-            links_url = api_url + "/links/all"
-            yield response.follow(
-                links_url,
-                self.parse_friend_page_mix_space_data,
-                cb_kwargs={"start": start_url},
-            )
-            return True
-        return False
-
-    def parse_friend_page_mix_space_data(self, response, **kwargs):
+    def parse_links_api(self, response, **kwargs):
         start_url = kwargs.get("start", response.url)
-        if response.status != 200:
-            return
-        if not response.headers.get("Content-Type", b"").startswith(
-            b"application/json"
-        ):
-            return
-        json_data = json.loads(response.body.decode("utf-8"))
-        if "data" not in json_data:
+        adapter = LINKS_ADAPTERS_BY_NAME[kwargs["adapter"]]
+        links = None
+        if response.status == 200 and response.headers.get(
+            "Content-Type", b""
+        ).startswith(b"application/json"):
+            try:
+                links = adapter.extract_links(json.loads(response.body.decode("utf-8")))
+            except ValueError:
+                links = None
+        if links is None:
+            self.fingerprints.forget(start_url)
+            yield from self.links_api_fallback(**kwargs)
             return
-        for link in json_data["data"]:
+
+        self.fingerprints.remember(
+            start_url, adapter.name, response.url, kwargs["page"]
+        )
+        yield {
+            "kind": "friends_page",
+            "start": start_url,
+            "target": kwargs["page"],
+        }
+        for link in links:
             yield {
                 "kind": "friends_link",
                 "start": start_url,
                 "from": response.url,
-                "target": link["url"],
-                "selector": "::mix_space",
+                "target": link,
+                "selector": f"::{adapter.name}",
             }
 
+    def on_links_api_error(self, failure: Failure):
+        request: scrapy.Request = failure.request  # type: ignore
+        self.fingerprints.forget(request.cb_kwargs["start"])
+        yield from self.links_api_fallback(**request.cb_kwargs)
+        self.on_request_error(failure)
+
+    def links_api_fallback(self, **kwargs):
+        start_url = kwargs["start"]
+        if kwargs.get("cached", False):
+            # the cached fingerprint is stale, crawl the member from its homepage again
+            yield scrapy.Request(
+                start_url,
+                dont_filter=True,
+                cb_kwargs={"start": start_url},
+                errback=self.on_request_error,
+            )
+        else:
+            yield scrapy.Request(
+                kwargs["page"],
+                self.parse_friends_page_generic,
+                dont_filter=True,
+                cb_kwargs={"start": start_url},
+                errback=self.on_request_error,
+            )
 
-def run_spider():
-    if os.path.exists("friends.lines.json"):
-        bak_time = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%SZ")
-        os.rename("friends.lines.json", f"friends.lines.json.bak.{bak_time}")
+
+def run_spider(
+    fresh: bool = False,
+    shard: tuple[int, int] | None = None,
+    keep_external: bool = False,
+):
+    if shard is None:
+        checkpoint = CrawlCheckpoint(keep_external=keep_external)
+        stats_path = "crawl-stats.json"
+    else:
+        checkpoint = CrawlCheckpoint(
+            output_path=shard_output_path(*shard),
+            state_dir=shard_state_dir(*shard),
+            external_path=shard_external_path(*shard),
+            keep_external=keep_external,
+        )
+        stats_path = shard_stats_path(*shard)
+    if fresh:
+        checkpoint.discard()
+    elif checkpoint.exists():
+        print("Resuming the unfinished crawl, run with `crawl --fresh` to start over")
+    member_diff = sync_members()
+    if shard is not None:
+        version = members_version(read_members())
+        pin_shard_members_version(*shard, version, resume=checkpoint.exists())
+    checkpoint.open()
     user_agent = " ".join(
         [
             "Mozilla/5.0 (Linux x86_64)",
@@ -399,12 +660,40 @@ def run_spider():
     process = CrawlerProcess(
         {
             "USER_AGENT": user_agent,
-            "FEED_FORMAT": "jsonlines",
-            "FEED_URI": "friends.lines.json",
+            "CONCURRENT_REQUESTS": 64,
+            "CONCURRENT_REQUESTS_PER_DOMAIN": 4,
+            "DOWNLOAD_TIMEOUT": 30,
+            "RETRY_TIMES": 1,
+            "AUTOTHROTTLE_ENABLED": True,
+            "AUTOTHROTTLE_START_DELAY": 0.5,
+            "AUTOTHROTTLE_MAX_DELAY": 30,
+            "AUTOTHROTTLE_TARGET_CONCURRENCY": 2.0,
+            # hard limit, CrawlBudgetMiddleware stops most downloads long before this
+            "DOWNLOAD_MAXSIZE": 16 * 1024 * 1024,
+            "CRAWL_REQUEST_MAXSIZE": 2 * 1024 * 1024,
+            "CRAWL_MEMBER_MAXSIZE": 8 * 1024 * 1024,
+            "CRAWL_STATS_PATH": stats_path,
+            "LOG_FORMATTER": "travellings_graph.crawl_resolve.QuietDropLogFormatter",
+            "DOWNLOADER_MIDDLEWARES": {
+                "travellings_graph.crawl_budget.CrawlBudgetMiddleware": 50,
+            },
+            "SPIDER_MIDDLEWARES": {
+                "travellings_graph.crawl_checkpoint.CheckpointMiddleware": 1000,
+            },
+            "ITEM_PIPELINES": {
+                "travellings_graph.crawl_resolve.MemberResolvePipeline": 300,
+                "travellings_graph.crawl_checkpoint.CheckpointPipeline": 1000,
+            },
         }
     )
-    process.crawl(FriendSpider)
+    process.crawl(
+        FriendSpider, checkpoint=checkpoint, shard=shard, member_diff=member_diff
+    )
     process.start()
+    # the checkpoint is only discarded once the crawl has finished,
+    # shards settle the changes when they are merged instead
+    if shard is None and not checkpoint.exists():
+        settle_pending_diff()
 
 
 if __name__ == "__main__":
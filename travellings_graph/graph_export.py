@@ -0,0 +1,173 @@
+import argparse
+import datetime
+import gzip
+import io
+import os
+import struct
+from abc import ABC, abstractmethod
+from typing import IO, Any, BinaryIO
+from xml.sax.saxutils import escape
+
+EXPORT_FORMATS = ["gexf", "graphml", "edgelist", "binary"]
+EXPORT_PATHS = {
+    "gexf": "graph.gexf",
+    "graphml": "graph.graphml",
+    "edgelist": "graph.edgelist",
+    "binary": "graph.edges.bin.gz",
+}
+BINARY_EDGES_MAGIC = b"TGEDGE01"
+
+
+def parse_export_formats(spec: str) -> list[str]:
+    formats = [name.strip() for name in spec.split(",") if name.strip()]
+    for name in formats:
+        if name not in EXPORT_FORMATS:
+            raise argparse.ArgumentTypeError(
+                f"unknown export format `{name}`, expected some of {EXPORT_FORMATS}"
+            )
+    return formats
+
+
+def xml_attr(value: str) -> str:
+    return escape(value, {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"})
+
+
+# Exporters write the graph while it is being built: all nodes first, then each edge once,
+# so no format needs the whole graph in memory.
+# Each one writes to a temporary file, which replaces the output only once the analysis
+# has succeeded (see `commit_exports`).
+class GraphExporter(ABC):
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file: IO[Any] = self.open_file()
+
+    def open_file(self) -> IO[Any]:
+        return open(self.tmp_path, "w", encoding="utf-8")
+
+    def begin(self, nodes: list[tuple[int, str]]):
+        pass
+
+    @abstractmethod
+    def edge(self, source: int, target: int): ...
+
+    def end(self):
+        pass
+
+    def close(self):
+        self.end()
+        self.file.close()
+
+    def commit(self):
+        os.replace(self.tmp_path, self.path)
+
+
+class GexfExporter(GraphExporter):
+    # the same document as nx.write_gexf, which Gephi and the server's fallback can read
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.edge_count = 0
+
+    def begin(self, nodes: list[tuple[int, str]]):
+        self.file.write(
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            + '<gexf xmlns="http://www.gexf.net/1.2draft" '
+            + 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            + 'xsi:schemaLocation="http://www.gexf.net/1.2draft '
+            + 'http://www.gexf.net/1.2draft/gexf.xsd" '
+            + 'version="1.2">\n'
+            + f'  <meta lastmodifieddate="{datetime.date.today().isoformat()}">\n'
+            + "    <creator>TravellingsGraph</creator>\n"
+            + "  </meta>\n"
+            + '  <graph defaultedgetype="directed" mode="static" name="">\n'
+            + '    <attributes mode="static" class="node">\n'
+            + '      <attribute id="0" title="name" type="string" />\n'
+            + "    </attributes>\n"
+            + "    <nodes>\n"
+        )
+        for node_id, name in nodes:
+            self.file.write(
+                f'      <node id="{node_id}" label="{node_id}">\n'
+                + "        <attvalues>\n"
+                + f'          <attvalue for="0" value="{xml_attr(name)}" />\n'
+                + "        </attvalues>\n"
+                + "      </node>\n"
+            )
+        self.file.write("    </nodes>\n    <edges>\n")
+
+    def edge(self, source: int, target: int):
+        self.file.write(
+            f'      <edge source="{source}" target="{target}" id="{self.edge_count}" />\n'
+        )
+        self.edge_count += 1
+
+    def end(self):
+        self.file.write("    </edges>\n  </graph>\n</gexf>\n")
+
+
+class GraphMLExporter(GraphExporter):
+    def begin(self, nodes: list[tuple[int, str]]):
+        self.file.write(
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            + '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+            + 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            + 'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+            + 'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+            + '  <key id="d0" for="node" attr.name="name" attr.type="string" />\n'
+            + '  <graph edgedefault="directed">\n'
+        )
+        for node_id, name in nodes:
+            self.file.write(
+                f'    <node id="{node_id}">\n'
+                + f'      <data key="d0">{escape(name)}</data>\n'
+                + "    </node>\n"
+            )
+
+    def edge(self, source: int, target: int):
+        self.file.write(f'    <edge source="{source}" target="{target}" />\n')
+
+    def end(self):
+        self.file.write("  </graph>\n</graphml>\n")
+
+
+class EdgeListExporter(GraphExporter):
+    # `source target` per line, as read by nx.read_edgelist (isolated members are not listed)
+    def edge(self, source: int, target: int):
+        self.file.write(f"{source} {target}\n")
+
+
+class BinaryEdgeListExporter(GraphExporter):
+    # gzip of the magic, then each edge as two little-endian uint32 member IDs
+    def open_file(self) -> BinaryIO:
+        # buffered, so the 8-byte edges reach the compressor in large writes
+        return io.BufferedWriter(gzip.GzipFile(self.tmp_path, "wb"))
+
+    def begin(self, nodes: list[tuple[int, str]]):
+        self.file.write(BINARY_EDGES_MAGIC)
+
+    def edge(self, source: int, target: int):
+        self.file.write(struct.pack("<II", source, target))
+
+
+EXPORTERS: dict[str, type[GraphExporter]] = {
+    "gexf": GexfExporter,
+    "graphml": GraphMLExporter,
+    "edgelist": EdgeListExporter,
+    "binary": BinaryEdgeListExporter,
+}
+
+
+def open_exporters(formats: list[str]) -> list[GraphExporter]:
+    return [EXPORTERS[name](EXPORT_PATHS[name]) for name in formats]
+
+
+def commit_exports(exporters: list[GraphExporter]):
+    # once the analysis has succeeded, the closed exports replace those of the earlier one,
+    # and its exports in the formats which are not written again are removed, since they
+    # would not match this one
+    for exporter in exporters:
+        exporter.commit()
+    exported = {exporter.path for exporter in exporters}
+    for path in EXPORT_PATHS.values():
+        if path not in exported and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,262 @@
+import array
+import bisect
+import json
+import os
+import sys
+from collections import deque
+from typing import Any, Iterable
+from travellings_graph.snapshot import (
+    ANALYSIS_FLOAT_COLUMNS,
+    ANALYSIS_INT_COLUMNS,
+    SectionFile,
+    write_sections,
+)
+
+HISTORY_DIR = "history"
+HISTORY_VERSION = 1
+# every n-th build stores its whole edge set, so a query never replays more than n - 1 deltas
+KEYFRAME_INTERVAL = 8
+
+
+def edge_key(source_id: int, target_id: int) -> int:
+    return source_id << 32 | target_id
+
+
+def edge_of_key(key: int) -> tuple[int, int]:
+    return key >> 32, key & 0xFFFFFFFF
+
+
+# Keeps every analyzed build in `history/`:
+# - `manifest.json` lists the builds in order, indexed by the build_time of build-info.json
+# - each build has its own file, in the same section format as graph.snapshot, with the
+#   metrics of every member and its edges, either as a keyframe (the whole edge set)
+#   or as a delta (edges added and removed) against the previous build
+class BuildHistory:
+    def __init__(self, path: str = HISTORY_DIR):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.builds: list[dict[str, Any]] = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != HISTORY_VERSION:
+                raise ValueError("Build history was written by another version")
+            self.builds = manifest["builds"]
+
+    @staticmethod
+    def empty() -> "BuildHistory":
+        # no builds, without reading the manifest
+        history = BuildHistory.__new__(BuildHistory)
+        history.path = HISTORY_DIR
+        history.manifest_path = os.path.join(HISTORY_DIR, "manifest.json")
+        history.builds = []
+        return history
+
+    def __len__(self) -> int:
+        return len(self.builds)
+
+    def save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": HISTORY_VERSION, "builds": self.builds}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def find(self, build_time: str) -> int | None:
+        # the position of the latest build at or before build_time
+        # (ISO 8601, so comparable as strings)
+        position = (
+            bisect.bisect_right(
+                [build["build_time"] for build in self.builds], build_time
+            )
+            - 1
+        )
+        return position if position >= 0 else None
+
+    def open_build(self, position: int) -> SectionFile:
+        return SectionFile.open(os.path.join(self.path, self.builds[position]["file"]))
+
+    def edges_at(self, position: int) -> set[int]:
+        keyframe = position
+        while not self.builds[keyframe]["keyframe"]:
+            keyframe -= 1
+        edges = set(self.open_build(keyframe)["edges"])
+        for delta in range(keyframe + 1, position + 1):
+            file = self.open_build(delta)
+            edges.difference_update(file["removed"])
+            edges.update(file["added"])
+        return edges
+
+    def metrics_at(self, position: int, member_id: int) -> dict[str, Any] | None:
+        file = self.open_build(position)
+        ids = file["ids"]
+        index = bisect.bisect_left(ids, member_id)
+        if index == len(ids) or ids[index] != member_id:
+            return None
+        return {
+            column: file[column][index]
+            for column in ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS
+        }
+
+    def all_metrics(self, position: int) -> dict[int, dict[str, Any]]:
+        file = self.open_build(position)
+        columns = {
+            column: file[column]
+            for column in ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS
+        }
+        return {
+            member_id: {column: values[index] for column, values in columns.items()}
+            for index, member_id in enumerate(file["ids"])
+        }
+
+    def member_metrics(self, member_id: int) -> list[tuple[str, dict[str, Any]]]:
+        result = []
+        for position, build in enumerate(self.builds):
+            metrics = self.metrics_at(position, member_id)
+            if metrics is not None:
+                result.append((build["build_time"], metrics))
+        return result
+
+    def edge_diff(
+        self, from_position: int, to_position: int
+    ) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+        before = self.edges_at(from_position)
+        after = self.edges_at(to_position)
+        return (
+            [edge_of_key(key) for key in sorted(after - before)],
+            [edge_of_key(key) for key in sorted(before - after)],
+        )
+
+    def distance_at(self, position: int, source_id: int, target_id: int) -> int | None:
+        successors: dict[int, list[int]] = {}
+        for key in self.edges_at(position):
+            source, target = edge_of_key(key)
+            successors.setdefault(source, []).append(target)
+        distances = {source_id: 0}
+        queue = deque([source_id])
+        while queue and target_id not in distances:
+            node = queue.popleft()
+            for successor in successors.get(node, []):
+                if successor not in distances:
+                    distances[successor] = distances[node] + 1
+                    queue.append(successor)
+        return distances.get(target_id)
+
+    def record(
+        self,
+        build_info: dict[str, Any],
+        items: list[dict[str, Any]],
+        edges: Iterable[tuple[int, int]],
+    ):
+        os.makedirs(self.path, exist_ok=True)
+        build_time = build_info["build_time"]
+        # analyzed again within the same second, replace that build
+        if self.builds and self.builds[-1]["build_time"] == build_time:
+            self.builds.pop()
+        if self.builds and self.builds[-1]["build_time"] > build_time:
+            raise ValueError(
+                f"Build {build_time} is older than the last recorded build"
+            )
+
+        keys = sorted(set(edge_key(source, target) for source, target in edges))
+        sections: dict[str, array.array | bytes] = {}
+        added: list[int] = []
+        removed: list[int] = []
+        keyframe = len(self.builds) == 0 or all(
+            not build["keyframe"] for build in self.builds[-(KEYFRAME_INTERVAL - 1) :]
+        )
+        if not keyframe:
+            previous = self.edges_at(len(self.builds) - 1)
+            added = sorted(set(keys) - previous)
+            removed = sorted(previous - set(keys))
+            # a delta larger than the edge set itself is not worth replaying
+            keyframe = len(added) + len(removed) >= len(keys)
+        if keyframe:
+            sections["edges"] = array.array("q", keys)
+        else:
+            sections["added"] = array.array("q", added)
+            sections["removed"] = array.array("q", removed)
+
+        items = sorted(items, key=lambda item: item["id"])
+        sections["ids"] = array.array("i", (item["id"] for item in items))
+        for column in ANALYSIS_INT_COLUMNS:
+            sections[column] = array.array("q", (item[column] for item in items))
+        for column in ANALYSIS_FLOAT_COLUMNS:
+            sections[column] = array.array("d", (item[column] for item in items))
+
+        file = "build-" + build_time.replace("-", "").replace(":", "") + ".bin"
+        write_sections(
+            os.path.join(self.path, file),
+            {
+                "version": HISTORY_VERSION,
+                "build_info": build_info,
+                "keyframe": keyframe,
+            },
+            sections,
+        )
+        self.builds.append(
+            {
+                "build_time": build_time,
+                "file": file,
+                "keyframe": keyframe,
+                "members": build_info["members"],
+                "connections": build_info["connections"],
+            }
+        )
+        self.save_manifest()
+
+
+def find_build(history: BuildHistory, build_time: str | None) -> int:
+    if len(history) == 0:
+        print("No build is recorded yet, please run with `analyze` first")
+        sys.exit(1)
+    if build_time is None:
+        return len(history) - 1
+    position = history.find(build_time)
+    if position is None:
+        print(f"No build is recorded at or before {build_time}")
+        sys.exit(1)
+    return position
+
+
+def print_builds(path: str = HISTORY_DIR):
+    history = BuildHistory(path)
+    for build in history.builds:
+        kind = "keyframe" if build["keyframe"] else "delta"
+        print(
+            f"{build['build_time']}  {build['members']} members  "
+            + f"{build['connections']} connections  ({kind})"
+        )
+
+
+def print_edge_diff(from_time: str, to_time: str | None, path: str = HISTORY_DIR):
+    history = BuildHistory(path)
+    from_position = find_build(history, from_time)
+    to_position = find_build(history, to_time)
+    added, removed = history.edge_diff(from_position, to_position)
+    from_build = history.builds[from_position]["build_time"]
+    to_build = history.builds[to_position]["build_time"]
+    print(f"{from_build} -> {to_build}: {len(added)} added, {len(removed)} removed")
+    for source, target in added:
+        print(f"+ {source} -> {target}")
+    for source, target in removed:
+        print(f"- {source} -> {target}")
+
+
+def print_member_metrics(member_id: int, path: str = HISTORY_DIR):
+    columns = ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS
+    print(",".join(["build_time"] + columns))
+    for build_time, metrics in BuildHistory(path).member_metrics(member_id):
+        print(",".join([build_time] + [str(metrics[column]) for column in columns]))
+
+
+def print_distance(
+    source_id: int, target_id: int, build_time: str | None, path: str = HISTORY_DIR
+):
+    history = BuildHistory(path)
+    position = find_build(history, build_time)
+    distance = history.distance_at(position, source_id, target_id)
+    at = history.builds[position]["build_time"]
+    if distance is None:
+        print(f"{source_id} cannot reach {target_id} at {at}")
+    else:
+        print(f"{source_id} -> {target_id}: {distance} at {at}")
@@ -1,10 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
+import datetime
+import hashlib
 import json
-from typing import Optional
+import os
+import sys
+from typing import Any, Optional
 import requests
 
+MEMBERS_API_URL = "https://api.travellings.cn/all"
+# members marked as lost by Travellings are not crawled
+DEAD_MEMBER_STATUSES = {"LOST"}
 
-@dataclass
+
+@dataclass(slots=True)
 class MemberRecord:
     id: int
     name: str
@@ -14,38 +22,171 @@ class MemberRecord:
     failed_reason: Optional[str] = None
 
 
-def download_members():
-    response = requests.get(
-        "https://api.travellings.cn/all",
-        timeout=30,
-        headers={
-            "User-Agent": " ".join(
-                [
-                    "Mozilla/5.0 (Linux x86_64)",
-                    "AppleWebKit/537.36 (KHTML, like Gecko)",
-                    "Chrome/124.0.0.0",
-                    "Safari/537.36",
-                    "TravellingsGraph/0.1 (Travellings.cn)",
-                ]
-            ),
-            "Referer": "https://list.travellings.cn/",
-        },
+@dataclass(slots=True)
+class MemberListDiff:
+    modified: bool = True
+    added: list[dict[str, Any]] = field(default_factory=list)
+    removed: list[dict[str, Any]] = field(default_factory=list)
+    url_changed: list[dict[str, Any]] = field(default_factory=list)
+    status_changed: list[dict[str, Any]] = field(default_factory=list)
+
+    def changed_ids(self) -> set[int]:
+        return {
+            change["id"]
+            for change in self.added + self.url_changed + self.status_changed
+        }
+
+
+def diff_members(
+    previous: list[MemberRecord], current: list[MemberRecord]
+) -> MemberListDiff:
+    previous_map = {member.id: member for member in previous}
+    current_map = {member.id: member for member in current}
+    diff = MemberListDiff()
+    for member in current:
+        old = previous_map.get(member.id)
+        if old is None:
+            diff.added.append({"id": member.id, "url": member.url})
+            continue
+        if old.url != member.url:
+            diff.url_changed.append(
+                {"id": member.id, "old": old.url, "new": member.url}
+            )
+        if old.status != member.status:
+            diff.status_changed.append(
+                {"id": member.id, "old": old.status, "new": member.status}
+            )
+    for member in previous:
+        if member.id not in current_map:
+            diff.removed.append({"id": member.id, "url": member.url})
+    return diff
+
+
+def members_version(members: list[MemberRecord]) -> str:
+    # identifies the list by what a crawl depends on, however the API happens to format it
+    digest = hashlib.blake2b(digest_size=8)
+    for member in sorted(members, key=lambda member: member.id):
+        digest.update(f"{member.id}\t{member.status}\t{member.url}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_text_atomic(path: str, text: str):
+    # several shards may sync at once, so each one writes its own temporary file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_json_atomic(path: str, data: Any):
+    write_text_atomic(path, json.dumps(data, indent=2))
+
+
+def read_pending_diff(diff_path: str = "members.diff.json") -> MemberListDiff | None:
+    # the changes saved by the last sync, if no finished crawl has used them yet
+    if not os.path.exists(diff_path):
+        return None
+    with open(diff_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if not data.get("pending", False):
+        return None
+    return MemberListDiff(
+        modified=data["modified"],
+        added=data["added"],
+        removed=data["removed"],
+        url_changed=data["url_changed"],
+        status_changed=data["status_changed"],
     )
-    response.raise_for_status()
-    with open("members.json", "w", encoding="utf-8") as file:
-        file.write(response.text)
 
 
-def read_members():
-    with open("members.json", "r", encoding="utf-8") as file:
+def settle_pending_diff(diff_path: str = "members.diff.json"):
+    # once a crawl using the changes has finished, the next one needn't favour those members
+    if not os.path.exists(diff_path):
+        return
+    with open(diff_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if data.get("pending", False):
+        data["pending"] = False
+        write_json_atomic(diff_path, data)
+
+
+def sync_members(
+    url: str | None = None,
+    path: str = "members.json",
+    meta_path: str = "members.meta.json",
+    diff_path: str = "members.diff.json",
+) -> MemberListDiff:
+    # Fetches the member list only if it changed since the last sync (by ETag / Last-Modified),
+    # and saves what changed in members.diff.json.
+    # The changes stay pending until settle_pending_diff, so a crawl which is resumed,
+    # or a shard started later, still gets them even though its own sync found nothing new.
+    headers = {
+        "User-Agent": " ".join(
+            [
+                "Mozilla/5.0 (Linux x86_64)",
+                "AppleWebKit/537.36 (KHTML, like Gecko)",
+                "Chrome/124.0.0.0",
+                "Safari/537.36",
+                "TravellingsGraph/0.1 (Travellings.cn)",
+            ]
+        ),
+        "Referer": "https://list.travellings.cn/",
+    }
+    meta = {}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = requests.get(url or MEMBERS_API_URL, timeout=30, headers=headers)
+    synced_at = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+    pending = read_pending_diff(diff_path)
+    if response.status_code == 304:
+        diff = pending if pending is not None else MemberListDiff()
+        diff.modified = False
+    else:
+        response.raise_for_status()
+        previous = read_members(path) if os.path.exists(path) else []
+        json.loads(response.text)  # don't replace the list with a broken one
+        write_text_atomic(path, response.text)
+        diff = diff_members(previous, read_members(path))
+        if pending is not None:
+            # the earlier changes were not crawled yet, keep them along with the new ones
+            diff.added = pending.added + diff.added
+            diff.removed = pending.removed + diff.removed
+            diff.url_changed = pending.url_changed + diff.url_changed
+            diff.status_changed = pending.status_changed + diff.status_changed
+        write_json_atomic(
+            diff_path, {"synced_at": synced_at, "pending": True, **asdict(diff)}
+        )
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    meta["synced_at"] = synced_at
+    write_json_atomic(meta_path, meta)
+    return diff
+
+
+def read_members(path: str = "members.json"):
+    with open(path, "r", encoding="utf-8") as file:
         result = json.load(file)
     members = [
         MemberRecord(
             id=member["id"],
             name=member["name"].strip(),
-            status=member["status"].strip(),
+            # statuses and tags repeat across thousands of members, share one string for each
+            status=sys.intern(member["status"].strip()),
             url=member["url"].strip().replace(":///", "://"),
-            tag=tuple(member["tag"].strip().split(",")) if member["tag"] else (),
+            tag=(
+                tuple(map(sys.intern, member["tag"].strip().split(",")))
+                if member["tag"]
+                else ()
+            ),
             failed_reason=member["failedReason"],
         )
         for member in result["data"]
@@ -0,0 +1,176 @@
+import array
+import bisect
+from typing import Iterable
+from travellings_graph.snapshot import SectionFile, encode_sections, write_sections
+
+REACHABILITY_MAX_HOPS = 6
+REACHABILITY_VERSION = 1
+REACHABILITY_DIRECTIONS = ["out", "in"]
+
+CONTAINER_ARRAY = 0
+CONTAINER_BITMAP = 1
+
+
+def bitmap_size(node_count: int) -> int:
+    # padded to 8 bytes, so every container stays aligned in the data section
+    return (node_count + 63) // 64 * 8
+
+
+# The nodes at each distance 1..max_hops from each node, in both directions.
+# Like in roaring bitmaps, every set is stored in the smaller of two containers:
+# a sorted array of node indexes for sparse sets, or a bitmap for dense ones.
+class ReachabilityBuilder:
+    def __init__(self, ids: list[int], max_hops: int = REACHABILITY_MAX_HOPS):
+        self.ids = ids
+        self.max_hops = max_hops
+        self.containers: dict[str, dict[int, list[tuple[int, int, bytes]]]] = {
+            direction: {} for direction in REACHABILITY_DIRECTIONS
+        }
+
+    def encode(self, indexes: list[int]) -> tuple[int, int, bytes]:
+        size = bitmap_size(len(self.ids))
+        if len(indexes) * 4 < size:
+            indexes.sort()
+            data = array.array("i", indexes).tobytes()
+            return CONTAINER_ARRAY, len(indexes), data + bytes((-len(data)) % 8)
+        bitmap = bytearray(size)
+        for index in indexes:
+            bitmap[index >> 3] |= 1 << (index & 7)
+        return CONTAINER_BITMAP, len(indexes), bytes(bitmap)
+
+    def add(self, direction: str, index: int, levels: list[list[int]]):
+        # levels[d] are the indexes of the nodes at distance d, as walked by the analyzer
+        self.containers[direction][index] = [
+            self.encode(list(levels[distance]) if distance < len(levels) else [])
+            for distance in range(1, self.max_hops + 1)
+        ]
+
+    def sections(self) -> dict[str, array.array | bytes]:
+        sections: dict[str, array.array | bytes] = {"ids": array.array("i", self.ids)}
+        empty = [(CONTAINER_ARRAY, 0, b"")] * self.max_hops
+        for direction in REACHABILITY_DIRECTIONS:
+            kinds = array.array("B")
+            counts = array.array("i")
+            offsets = array.array("q", [0])
+            data = bytearray()
+            for index in range(len(self.ids)):
+                for kind, count, container in self.containers[direction].get(
+                    index, empty
+                ):
+                    kinds.append(kind)
+                    counts.append(count)
+                    data += container
+                    offsets.append(len(data))
+            sections[f"{direction}_kinds"] = kinds
+            sections[f"{direction}_counts"] = counts
+            sections[f"{direction}_offsets"] = offsets
+            sections[f"{direction}_data"] = bytes(data)
+        return sections
+
+    def meta(self) -> dict:
+        return {"version": REACHABILITY_VERSION, "max_hops": self.max_hops}
+
+    def write(self, path: str = "reachability.bin"):
+        write_sections(path, self.meta(), self.sections())
+
+
+class ReachabilityIndex:
+    def __init__(self, file: SectionFile):
+        if file.meta.get("version") != REACHABILITY_VERSION:
+            raise ValueError(
+                "Reachability index was written by another version, please analyze again"
+            )
+        self.file = file
+        self.max_hops: int = file.meta["max_hops"]
+        self.ids = file["ids"]
+        self.kinds = {
+            direction: file[f"{direction}_kinds"]
+            for direction in REACHABILITY_DIRECTIONS
+        }
+        self.counts = {
+            direction: file[f"{direction}_counts"]
+            for direction in REACHABILITY_DIRECTIONS
+        }
+        self.offsets = {
+            direction: file[f"{direction}_offsets"]
+            for direction in REACHABILITY_DIRECTIONS
+        }
+        self.data = {
+            direction: file[f"{direction}_data"]
+            for direction in REACHABILITY_DIRECTIONS
+        }
+
+    @staticmethod
+    def open(path: str = "reachability.bin") -> "ReachabilityIndex":
+        return ReachabilityIndex(SectionFile.open(path))
+
+    @staticmethod
+    def empty() -> "ReachabilityIndex":
+        builder = ReachabilityBuilder([])
+        return ReachabilityIndex(
+            SectionFile(encode_sections(builder.meta(), builder.sections()))
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def container(
+        self, direction: str, index: int, distance: int
+    ) -> tuple[int, memoryview]:
+        slot = index * self.max_hops + distance - 1
+        offsets = self.offsets[direction]
+        data = self.data[direction][offsets[slot] : offsets[slot + 1]]
+        if self.kinds[direction][slot] == CONTAINER_ARRAY:
+            return CONTAINER_ARRAY, data.cast("i")[: self.counts[direction][slot]]
+        return CONTAINER_BITMAP, data
+
+    def count(self, direction: str, index: int, max_hops: int) -> int:
+        counts = self.counts[direction]
+        slot = index * self.max_hops
+        return sum(counts[slot : slot + min(max_hops, self.max_hops)])
+
+    def distance(
+        self, direction: str, index: int, other: int, max_hops: int
+    ) -> int | None:
+        # distance from index to other (or from other to index for "in"), if within max_hops
+        for distance in range(1, min(max_hops, self.max_hops) + 1):
+            kind, container = self.container(direction, index, distance)
+            if kind == CONTAINER_ARRAY:
+                position = bisect.bisect_left(container, other)
+                if position < len(container) and container[position] == other:
+                    return distance
+            elif container[other >> 3] & (1 << (other & 7)):
+                return distance
+        return None
+
+    def bitset(self, direction: str, index: int, max_hops: int) -> int:
+        # the nodes within max_hops as a Python int, for fast set operations
+        result = 0
+        for distance in range(1, min(max_hops, self.max_hops) + 1):
+            kind, container = self.container(direction, index, distance)
+            if kind == CONTAINER_ARRAY:
+                for other in container:
+                    result |= 1 << other
+            else:
+                result |= int.from_bytes(container, "little")
+        return result
+
+    def members(self, direction: str, index: int, max_hops: int) -> list[int]:
+        # the nodes within max_hops, nearest first
+        result = []
+        for distance in range(1, min(max_hops, self.max_hops) + 1):
+            kind, container = self.container(direction, index, distance)
+            if kind == CONTAINER_ARRAY:
+                result.extend(container)
+            else:
+                result.extend(bitset_members(int.from_bytes(container, "little")))
+        return result
+
+
+def bitset_members(bitset: int) -> Iterable[int]:
+    data = bitset.to_bytes((bitset.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield byte_index * 8 + low.bit_length() - 1
+            byte ^= low
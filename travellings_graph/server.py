@@ -1,15 +1,35 @@
 import asyncio
+import base64
+import binascii
+from contextlib import asynccontextmanager
 import csv
-from typing import Optional
+import functools
+import json
+import os
+import sys
+from typing import Literal, Optional, Sequence
 from attr import dataclass
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import networkx as nx
+from fastapi.responses import JSONResponse, Response
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
+from hypercorn.run import run as hypercorn_run
 from pydantic import BaseModel
 from travellings_graph.domain_utils import strip_host
+from travellings_graph.history import BuildHistory
+from travellings_graph.reachability import (
+    REACHABILITY_MAX_HOPS,
+    ReachabilityIndex,
+    bitset_members,
+)
+from travellings_graph.snapshot import (
+    GRAPH_SNAPSHOT_VERSION,
+    GraphSnapshot,
+    SectionFile,
+    encode_json,
+    write_graph_snapshot,
+)
 
 
 class BuildInfo(BaseModel):
@@ -55,6 +75,17 @@ class GetAnalysisByPageResponse(BaseModel):
     items: list[AnalysisItem]
 
 
+class GetAnalysisListResponse(BaseModel):
+    build_info: BuildInfo
+    total_items: Optional[int]
+    items: list[AnalysisItem]
+    next_cursor: Optional[str]
+
+
+class GetAnalysisErrorResponse(BaseModel):
+    detail: str
+
+
 class BlogBrief(BaseModel):
     id: int
     name: str
@@ -83,66 +114,256 @@ class GetPredecessorsResponse(BaseModel):
     nodes: list[BlogBrief]
 
 
+class NeighborhoodLayer(BaseModel):
+    distance: int
+    nodes: list[BlogBrief]
+
+
+class GetNeighborhoodResponse(BaseModel):
+    source_id: int
+    depth: int
+    direction: str
+    total_nodes: int
+    truncated: bool
+    layers: list[NeighborhoodLayer]
+    edges: list[list[int]]
+    next_cursor: Optional[str]
+
+
+class GetNeighborhoodErrorResponse(BaseModel):
+    detail: str
+
+
+class GetReachabilityResponse(BaseModel):
+    source_id: int
+    target_id: int
+    max_hops: int
+    reachable: bool
+    distance: int
+
+
+class GetReachableResponse(BaseModel):
+    node_id: int
+    direction: str
+    max_hops: int
+    total: int
+    nodes: list[BlogBrief]
+    next_cursor: Optional[str]
+
+
+class GetCommonReachableResponse(BaseModel):
+    node_ids: list[int]
+    direction: str
+    max_hops: int
+    total: int
+    nodes: list[BlogBrief]
+    next_cursor: Optional[str]
+
+
+class GetReachabilityErrorResponse(BaseModel):
+    detail: str
+
+
+class HistoryBuild(BaseModel):
+    build_time: str
+    members: int
+    connections: int
+
+
+class GetHistoryBuildsResponse(BaseModel):
+    builds: list[HistoryBuild]
+
+
+class MemberMetrics(BaseModel):
+    build_time: str
+    outgoing_count: int
+    outgoing_count_in6degrees: int
+    outgoing_average_distance: float
+    incoming_count: int
+    incoming_count_in6degrees: int
+    incoming_average_distance: float
+
+
+class GetHistoryMemberResponse(BaseModel):
+    member_id: int
+    metrics: list[MemberMetrics]
+
+
+class GetHistoryDiffResponse(BaseModel):
+    from_build: str
+    to_build: str
+    added: list[list[int]]
+    removed: list[list[int]]
+
+
+class GetHistoryDistanceResponse(BaseModel):
+    build_time: str
+    source_id: int
+    target_id: int
+    distance: int
+
+
+class GetHistoryErrorResponse(BaseModel):
+    detail: str
+
+
 @dataclass
 class GlobalData:
     build_info: BuildInfo
-    analysis: list[AnalysisItem]
-    analysis_id_map: dict[int, AnalysisItem]
-    analysis_host_map: dict[str, AnalysisItem]
-    graph: nx.DiGraph
+    snapshot: GraphSnapshot
+    reachability: Optional[ReachabilityIndex]
+    history: BuildHistory
 
     @staticmethod
     def no_data() -> "GlobalData":
         return GlobalData(
             build_info=BuildInfo.no_data(),
-            analysis=[],
-            analysis_id_map={},
-            analysis_host_map={},
-            graph=nx.DiGraph(),
+            snapshot=GraphSnapshot.empty(),
+            reachability=ReachabilityIndex.empty(),
+            history=BuildHistory.empty(),
         )
 
 
-def reload() -> GlobalData:
-    analysis: list[AnalysisItem] = []
+def snapshot_is_fresh(path: str = "graph.snapshot") -> bool:
+    if not os.path.exists(path):
+        return False
+    if SectionFile.open(path).meta.get("version") != GRAPH_SNAPSHOT_VERSION:
+        return False
+    snapshot_time = os.path.getmtime(path)
+    return all(
+        not os.path.exists(source) or os.path.getmtime(source) <= snapshot_time
+        for source in ["analysis.csv", "graph.gexf", "build-info.json"]
+    )
+
+
+def build_snapshot(path: str = "graph.snapshot"):
+    # only needed for data analyzed before the analyzer wrote snapshots itself
+    import networkx as nx  # pylint: disable=import-outside-toplevel
+
+    items = []
     with open("analysis.csv", "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            analysis.append(
-                AnalysisItem(
-                    id=int(row["ID"]),
-                    name=row["Name"],
-                    url=row["URL"],
-                    links=row["Links"],
-                    outgoing_count=int(row["OutgoingCount"]),
-                    outgoing_count_in6degrees=int(row["OutgoingCountIn6Degrees"]),
-                    outgoing_average_distance=float(row["OutgoingAverage"]),
-                    incoming_count=int(row["IncomingCount"]),
-                    incoming_count_in6degrees=int(row["IncomingCountIn6Degrees"]),
-                    incoming_average_distance=float(row["IncomingAverage"]),
-                )
+            items.append(
+                {
+                    "id": int(row["ID"]),
+                    "name": row["Name"],
+                    "url": row["URL"],
+                    "links": row["Links"],
+                    "outgoing_count": int(row["OutgoingCount"]),
+                    "outgoing_count_in6degrees": int(row["OutgoingCountIn6Degrees"]),
+                    "outgoing_average_distance": float(row["OutgoingAverage"]),
+                    "incoming_count": int(row["IncomingCount"]),
+                    "incoming_count_in6degrees": int(row["IncomingCountIn6Degrees"]),
+                    "incoming_average_distance": float(row["IncomingAverage"]),
+                }
             )
 
-    analysis_id_map = {item.id: item for item in analysis}
-    analysis_host_map = {strip_host(item.url): item for item in analysis}
-
     graph = nx.read_gexf("graph.gexf", node_type=int)
     if not isinstance(graph, nx.DiGraph):
         raise ValueError("Invalid graph type")
 
     with open("build-info.json", "r", encoding="utf-8") as f:
-        build_info = BuildInfo.model_validate_json(f.read())
+        build_info = json.load(f)
+
+    write_graph_snapshot(path, build_info, items, graph.edges)
+
+
+def prepare_snapshot(path: str = "graph.snapshot"):
+    if not snapshot_is_fresh(path):
+        if not os.path.exists("graph.gexf"):
+            print(
+                "Graph snapshot is missing or outdated, please run with `analyze` again"
+            )
+            sys.exit(1)
+        build_snapshot(path)
+
+
+def load_reachability(
+    snapshot: GraphSnapshot, snapshot_path: str, path: str = "reachability.bin"
+) -> Optional[ReachabilityIndex]:
+    # written by the analyzer after the snapshot, so an older one belongs to another build
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(
+        snapshot_path
+    ):
+        return None
+    try:
+        reachability = ReachabilityIndex.open(path)
+    except ValueError:
+        return None
+    if reachability.ids != snapshot.ids:
+        return None
+    return reachability
 
+
+def reload(path: str = "graph.snapshot") -> GlobalData:
+    snapshot = GraphSnapshot.open(path)
     return GlobalData(
-        build_info=build_info,
-        analysis=analysis,
-        analysis_id_map=analysis_id_map,
-        analysis_host_map=analysis_host_map,
-        graph=graph,
+        build_info=BuildInfo.model_validate(snapshot.meta["build_info"]),
+        snapshot=snapshot,
+        reachability=load_reachability(snapshot, path),
+        # the manifest is read once, the build files are only opened by the queries
+        history=BuildHistory(),
+    )
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # every worker maps the same snapshot file, so the pages are shared between them
+    global global_data  # pylint: disable=global-statement
+    global_data = reload()
+    yield
+
+
+def json_response(*fragments: bytes | memoryview) -> Response:
+    # responses assembled from the pre-encoded fragments of the snapshot, without building models
+    return Response(content=b"".join(fragments), media_type="application/json")
+
+
+def build_scope(scope: str) -> str:
+    # positions point at different nodes in another build, so the build is part of the scope
+    return f"{global_data.build_info.build_time}/{scope}"
+
+
+def encode_cursor(scope: str, position: int) -> str:
+    cursor = f"{build_scope(scope)}:{position}"
+    return base64.urlsafe_b64encode(cursor.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], scope: str) -> Optional[int]:
+    # Every paginated endpoint uses the same opaque cursor: a position in its result,
+    # only valid for the build and the query parameters it was made for (the scope).
+    if cursor is None:
+        return 0
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursor_scope, position = decoded.rsplit(":", 1)
+        if cursor_scope != build_scope(scope) or int(position) < 0:
+            return None
+        return int(position)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def analysis_item(index: int) -> AnalysisItem:
+    snapshot = global_data.snapshot
+    columns = snapshot.columns
+    return AnalysisItem(
+        id=snapshot.ids[index],
+        name=snapshot.names[index],
+        url=snapshot.urls[index],
+        links=snapshot.links[index],
+        outgoing_count=columns["outgoing_count"][index],
+        outgoing_count_in6degrees=columns["outgoing_count_in6degrees"][index],
+        outgoing_average_distance=columns["outgoing_average_distance"][index],
+        incoming_count=columns["incoming_count"][index],
+        incoming_count_in6degrees=columns["incoming_count_in6degrees"][index],
+        incoming_average_distance=columns["incoming_average_distance"][index],
     )
 
 
 global_data: GlobalData = GlobalData.no_data()
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -156,47 +377,105 @@ app.add_middleware(
 def get_analysis_all() -> GetAnalysisAllResponse:
     return GetAnalysisAllResponse(
         build_info=global_data.build_info,
-        total=len(global_data.analysis),
-        items=global_data.analysis,
+        total=len(global_data.snapshot),
+        items=[analysis_item(index) for index in range(len(global_data.snapshot))],
     )
 
 
+AnalysisSortKey = Literal[
+    "id",
+    "outgoing_count",
+    "outgoing_count_in6degrees",
+    "outgoing_average_distance",
+    "incoming_count",
+    "incoming_count_in6degrees",
+    "incoming_average_distance",
+]
+
+
+def analysis_matches(index: int, q: str) -> bool:
+    snapshot = global_data.snapshot
+    return (
+        q in str(snapshot.ids[index])
+        or q in snapshot.names[index].lower()
+        or q in snapshot.urls[index].lower()
+        or q in snapshot.links[index].lower()
+    )
+
+
+def analysis_order(
+    sort: Optional[AnalysisSortKey], order: Literal["asc", "desc"]
+) -> Sequence[int]:
+    return global_data.snapshot.ordered(sort or "", order == "desc")
+
+
 @app.get("/v1/analysis/page/{page}")
-def get_analysis_by_page(page: int, q: str | None = None) -> GetAnalysisByPageResponse:
-    data = global_data.analysis
+def get_analysis_by_page(
+    page: int,
+    q: str | None = None,
+    sort: Optional[AnalysisSortKey] = None,
+    order: Literal["asc", "desc"] = "asc",
+    per_page: int = Query(default=32, ge=1, le=1000),
+) -> GetAnalysisByPageResponse:
+    data = analysis_order(sort, order)
     if q is not None:
         q = q.lower()
-        data = [
-            item
-            for item in data
-            if q in str(item.id)
-            or q in item.name.lower()
-            or q in item.url.lower()
-            or q in item.links.lower()
-        ]
-    item_per_page = 32
-    total_page = (len(data) + item_per_page - 1) // item_per_page
-    items = data[(page - 1) * item_per_page : page * item_per_page]
+        data = [index for index in data if analysis_matches(index, q)]
+    total_page = (len(data) + per_page - 1) // per_page
+    items = data[(page - 1) * per_page : page * per_page]
     return GetAnalysisByPageResponse(
         build_info=global_data.build_info,
         total_items=len(data),
         total_page=total_page,
         page=page,
+        items=[analysis_item(index) for index in items],
+    )
+
+
+@app.get(
+    "/v1/analysis/list",
+    response_model=GetAnalysisListResponse,
+    responses={400: {"model": GetAnalysisErrorResponse}},
+)
+def get_analysis_list(
+    sort: Optional[AnalysisSortKey] = None,
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(default=32, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+) -> GetAnalysisListResponse | JSONResponse:
+    # Walks the precomputed sort order from the cursor, so a page costs O(limit) however deep it is.
+    # With `q`, the order is filtered while walking, and `total_items` is not counted.
+    data = analysis_order(sort, order)
+    if q is not None:
+        q = q.lower()
+    # the cursor is a position in the sort order, and skips what `q` filtered out before it
+    scope = f"{sort or ''}:{order}:{q or ''}"
+    position = decode_cursor(cursor, scope)
+    if position is None:
+        return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+    items = []
+    while position < len(data) and len(items) < limit:
+        index = data[position]
+        position += 1
+        if q is None or analysis_matches(index, q):
+            items.append(analysis_item(index))
+    return GetAnalysisListResponse(
+        build_info=global_data.build_info,
+        total_items=len(data) if q is None else None,
         items=items,
+        next_cursor=(encode_cursor(scope, position) if position < len(data) else None),
     )
 
 
-def try_get_node_id(node: str) -> Optional[int]:
+def try_get_node_index(node: str) -> Optional[int]:
     try:
         node_id = int(node, base=10)
-        if node_id in global_data.analysis_id_map:
-            return node_id
+        return global_data.snapshot.index_of_id(node_id)
     except ValueError:
         host = strip_host(node)
-        item = global_data.analysis_host_map.get(host)
-        if item is not None:
-            return item.id
-    return None
+        return global_data.snapshot.index_of_host(host)
 
 
 @app.get(
@@ -204,124 +483,420 @@ def try_get_node_id(node: str) -> Optional[int]:
     response_model=GetShortestPathsResponse,
     responses={404: {"model": GetShortestPathsNotFoundResponse}},
 )
-def get_shortest_paths(
-    source: str, target: str
-) -> GetShortestPathsResponse | JSONResponse:
-    source_id = try_get_node_id(source)
-    target_id = try_get_node_id(target)
-    if source_id is None:
+def get_shortest_paths(source: str, target: str) -> Response:
+    source_index = try_get_node_index(source)
+    target_index = try_get_node_index(target)
+    if source_index is None:
         return JSONResponse(
             status_code=404,
             content={
                 "detail": "Source not found",
             },
         )
-    if target_id is None:
+    if target_index is None:
         return JSONResponse(
             status_code=404,
             content={
                 "detail": "Target not found",
             },
         )
-    try:
-        paths = list(nx.all_shortest_paths(global_data.graph, source_id, target_id))
-        nodes = []
-        node_set = set()
-        for path in paths:
-            for node_id in path:
-                if node_id not in node_set:
-                    node_set.add(node_id)
-                    node = global_data.analysis_id_map[node_id]
-                    nodes.append(
-                        BlogBrief(
-                            id=node.id,
-                            name=node.name,
-                            url=node.url,
-                        )
-                    )
-        return GetShortestPathsResponse(
-            source_id=source_id,
-            target_id=target_id,
-            distance=len(paths[0]) - 1,
-            nodes=nodes,
-            paths=paths,
-        )
-    except nx.NetworkXNoPath:
-        source_node_brief = BlogBrief(
-            id=source_id,
-            name=global_data.analysis_id_map[source_id].name,
-            url=global_data.analysis_id_map[source_id].url,
-        )
-        target_node_brief = BlogBrief(
-            id=target_id,
-            name=global_data.analysis_id_map[target_id].name,
-            url=global_data.analysis_id_map[target_id].url,
-        )
-        return GetShortestPathsResponse(
-            source_id=source_id,
-            target_id=target_id,
-            distance=-1,
-            nodes=[source_node_brief, target_node_brief],
-            paths=[],
-        )
+    snapshot = global_data.snapshot
+    source_id = snapshot.ids[source_index]
+    target_id = snapshot.ids[target_index]
+    paths = snapshot.shortest_paths(source_index, target_index)
+    if len(paths) == 0:
+        nodes = [source_index, target_index]
+    else:
+        nodes = list(dict.fromkeys(node_index for path in paths for node_index in path))
+    return json_response(
+        b'{"source_id":',
+        str(source_id).encode(),
+        b',"target_id":',
+        str(target_id).encode(),
+        b',"distance":',
+        str(len(paths[0]) - 1 if len(paths) else -1).encode(),
+        b',"nodes":[',
+        b",".join(snapshot.briefs_json.raw(node_index) for node_index in nodes),
+        b'],"paths":',
+        encode_json(
+            [[snapshot.ids[node_index] for node_index in path] for path in paths]
+        ).encode(),
+        b"}",
+    )
 
 
-@app.get("/v1/successors/{source_id}")
-def get_successors(source_id: int) -> GetSuccessorsResponse:
-    try:
-        successors = list(global_data.graph.successors(source_id))
-        nodes = []
-        for node_id in successors:
-            node = global_data.analysis_id_map[node_id]
-            nodes.append(
-                BlogBrief(
-                    id=node.id,
-                    name=node.name,
-                    url=node.url,
-                )
-            )
-        return GetSuccessorsResponse(
-            source_id=source_id,
-            nodes=nodes,
-        )
-    except nx.NetworkXError:
-        return GetSuccessorsResponse(
-            source_id=source_id,
-            nodes=[],
-        )
+@app.get("/v1/successors/{source_id}", response_model=GetSuccessorsResponse)
+def get_successors(source_id: int) -> Response:
+    index = global_data.snapshot.index_of_id(source_id)
+    return json_response(
+        b'{"source_id":',
+        str(source_id).encode(),
+        b',"nodes":',
+        global_data.snapshot.successors_json.raw(index) if index is not None else b"[]",
+        b"}",
+    )
 
 
-@app.get("/v1/predecessors/{target_id}")
-def get_predecessors(target_id: int) -> GetPredecessorsResponse:
-    try:
-        predecessors = list(global_data.graph.predecessors(target_id))
-        nodes = []
-        for node_id in predecessors:
-            node = global_data.analysis_id_map[node_id]
-            nodes.append(
-                BlogBrief(
-                    id=node.id,
-                    name=node.name,
-                    url=node.url,
-                )
+@app.get("/v1/predecessors/{target_id}", response_model=GetPredecessorsResponse)
+def get_predecessors(target_id: int) -> Response:
+    index = global_data.snapshot.index_of_id(target_id)
+    return json_response(
+        b'{"target_id":',
+        str(target_id).encode(),
+        b',"nodes":',
+        (
+            global_data.snapshot.predecessors_json.raw(index)
+            if index is not None
+            else b"[]"
+        ),
+        b"}",
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def cached_neighborhood(
+    snapshot: GraphSnapshot, index: int, depth: int, direction: str, max_nodes: int
+) -> tuple[list[int], list[int], bool]:
+    # the pages of one neighborhood are usually fetched in a row, don't search again for each
+    return snapshot.neighborhood(index, depth, direction, max_nodes)
+
+
+def neighborhood_layers_json(
+    snapshot: GraphSnapshot,
+    nodes: list[int],
+    distances: list[int],
+    offset: int,
+    page_end: int,
+) -> bytes:
+    # the nodes of the page grouped by their distance, as pre-encoded briefs
+    layers: list[tuple[int, list[bytes | memoryview]]] = []
+    for i in range(offset, page_end):
+        if len(layers) == 0 or layers[-1][0] != distances[i]:
+            layers.append((distances[i], []))
+        layers[-1][1].append(snapshot.briefs_json.raw(nodes[i]))
+    return b",".join(
+        b'{"distance":'
+        + str(distance).encode()
+        + b',"nodes":['
+        + b",".join(briefs)
+        + b"]}"
+        for distance, briefs in layers
+    )
+
+
+def neighborhood_edges(
+    snapshot: GraphSnapshot, nodes: list[int], offset: int, page_end: int
+) -> list[list[int]]:
+    position = {node_index: i for i, node_index in enumerate(nodes[:page_end])}
+    edges = []
+    for i in range(offset, page_end):
+        for successor in snapshot.successors(nodes[i]):
+            if successor in position:
+                edges.append([snapshot.ids[nodes[i]], snapshot.ids[successor]])
+        for predecessor in snapshot.predecessors(nodes[i]):
+            # edges within the page are already found as successors
+            if position.get(predecessor, page_end) < offset:
+                edges.append([snapshot.ids[predecessor], snapshot.ids[nodes[i]]])
+    return edges
+
+
+@app.get(
+    "/v1/neighborhood/{node}",
+    response_model=GetNeighborhoodResponse,
+    responses={
+        400: {"model": GetNeighborhoodErrorResponse},
+        404: {"model": GetNeighborhoodErrorResponse},
+    },
+)
+def get_neighborhood(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    node: str,
+    depth: int = Query(default=2, ge=1, le=10),
+    direction: Literal["out", "in", "both"] = "out",
+    limit: int = Query(default=200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    max_nodes: int = Query(default=2000, ge=1, le=20000),
+) -> Response:
+    # Nodes within `depth` hops, in BFS order (so grouped by distance) and paginated by `cursor`.
+    # `edges` are the edges between the nodes of this page and the nodes up to this page,
+    # so a client accumulating the pages gets the induced subgraph.
+    index = try_get_node_index(node)
+    if index is None:
+        return JSONResponse(status_code=404, content={"detail": "Node not found"})
+    snapshot = global_data.snapshot
+    scope = f"neighborhood:{snapshot.ids[index]}:{depth}:{direction}:{max_nodes}"
+    offset = decode_cursor(cursor, scope)
+    if offset is None:
+        return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+    nodes, distances, truncated = cached_neighborhood(
+        snapshot, index, depth, direction, max_nodes
+    )
+    page_end = min(offset + limit, len(nodes))
+    return json_response(
+        b'{"source_id":',
+        str(snapshot.ids[index]).encode(),
+        b',"depth":',
+        str(depth).encode(),
+        b',"direction":',
+        encode_json(direction).encode(),
+        b',"total_nodes":',
+        str(len(nodes)).encode(),
+        b',"truncated":',
+        b"true" if truncated else b"false",
+        b',"layers":[',
+        neighborhood_layers_json(snapshot, nodes, distances, offset, page_end),
+        b'],"edges":',
+        encode_json(neighborhood_edges(snapshot, nodes, offset, page_end)).encode(),
+        b',"next_cursor":',
+        encode_json(
+            encode_cursor(scope, page_end) if page_end < len(nodes) else None
+        ).encode(),
+        b"}",
+    )
+
+
+REACHABILITY_NOT_BUILT = "Reachability index is not built, please run `analyze` again"
+
+
+@app.get(
+    "/v1/reachability/{source}/{target}",
+    response_model=GetReachabilityResponse,
+    responses={
+        404: {"model": GetReachabilityErrorResponse},
+        503: {"model": GetReachabilityErrorResponse},
+    },
+)
+def get_reachability(
+    source: str,
+    target: str,
+    max_hops: int = Query(
+        default=REACHABILITY_MAX_HOPS, ge=1, le=REACHABILITY_MAX_HOPS
+    ),
+) -> Response:
+    # whether target is within max_hops of source, answered from the precomputed index
+    reachability = global_data.reachability
+    if reachability is None:
+        return JSONResponse(status_code=503, content={"detail": REACHABILITY_NOT_BUILT})
+    source_index = try_get_node_index(source)
+    if source_index is None:
+        return JSONResponse(status_code=404, content={"detail": "Source not found"})
+    target_index = try_get_node_index(target)
+    if target_index is None:
+        return JSONResponse(status_code=404, content={"detail": "Target not found"})
+    if source_index == target_index:
+        distance = 0
+    else:
+        distance = reachability.distance("out", source_index, target_index, max_hops)
+    snapshot = global_data.snapshot
+    return json_response(
+        b'{"source_id":',
+        str(snapshot.ids[source_index]).encode(),
+        b',"target_id":',
+        str(snapshot.ids[target_index]).encode(),
+        b',"max_hops":',
+        str(max_hops).encode(),
+        b',"reachable":',
+        b"true" if distance is not None else b"false",
+        b',"distance":',
+        str(distance if distance is not None else -1).encode(),
+        b"}",
+    )
+
+
+def reachable_page(
+    nodes: list[int], scope: str, offset: int, limit: int
+) -> list[bytes]:
+    page_end = min(offset + limit, len(nodes))
+    return [
+        b',"total":',
+        str(len(nodes)).encode(),
+        b',"nodes":[',
+        b",".join(
+            global_data.snapshot.briefs_json.raw(node)
+            for node in nodes[offset:page_end]
+        ),
+        b'],"next_cursor":',
+        encode_json(
+            encode_cursor(scope, page_end) if page_end < len(nodes) else None
+        ).encode(),
+        b"}",
+    ]
+
+
+@app.get(
+    "/v1/reachability/{node}",
+    response_model=GetReachableResponse,
+    responses={
+        400: {"model": GetReachabilityErrorResponse},
+        404: {"model": GetReachabilityErrorResponse},
+        503: {"model": GetReachabilityErrorResponse},
+    },
+)
+def get_reachable(
+    node: str,
+    direction: Literal["out", "in"] = "out",
+    max_hops: int = Query(
+        default=REACHABILITY_MAX_HOPS, ge=1, le=REACHABILITY_MAX_HOPS
+    ),
+    limit: int = Query(default=200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> Response:
+    # members the node reaches (out) or is reached by (in) within max_hops, nearest first
+    reachability = global_data.reachability
+    if reachability is None:
+        return JSONResponse(status_code=503, content={"detail": REACHABILITY_NOT_BUILT})
+    index = try_get_node_index(node)
+    if index is None:
+        return JSONResponse(status_code=404, content={"detail": "Node not found"})
+    scope = f"reachability:{global_data.snapshot.ids[index]}:{direction}:{max_hops}"
+    offset = decode_cursor(cursor, scope)
+    if offset is None:
+        return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+    return json_response(
+        b'{"node_id":',
+        str(global_data.snapshot.ids[index]).encode(),
+        b',"direction":',
+        encode_json(direction).encode(),
+        b',"max_hops":',
+        str(max_hops).encode(),
+        *reachable_page(
+            reachability.members(direction, index, max_hops), scope, offset, limit
+        ),
+    )
+
+
+@app.get(
+    "/v1/common-reachability",
+    response_model=GetCommonReachableResponse,
+    responses={
+        400: {"model": GetReachabilityErrorResponse},
+        404: {"model": GetReachabilityErrorResponse},
+        503: {"model": GetReachabilityErrorResponse},
+    },
+)
+def get_common_reachable(
+    nodes: list[str] = Query(min_length=1, max_length=16),
+    direction: Literal["out", "in"] = "out",
+    max_hops: int = Query(default=3, ge=1, le=REACHABILITY_MAX_HOPS),
+    limit: int = Query(default=200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> Response:
+    # members all the given nodes reach (out) or are reached by (in) within max_hops
+    reachability = global_data.reachability
+    if reachability is None:
+        return JSONResponse(status_code=503, content={"detail": REACHABILITY_NOT_BUILT})
+    indexes = []
+    for node in nodes:
+        index = try_get_node_index(node)
+        if index is None:
+            return JSONResponse(
+                status_code=404, content={"detail": f"Node {node} not found"}
             )
-        return GetPredecessorsResponse(
-            target_id=target_id,
-            nodes=nodes,
-        )
-    except nx.NetworkXError:
-        return GetPredecessorsResponse(
-            target_id=target_id,
-            nodes=[],
-        )
+        indexes.append(index)
+    node_ids = [global_data.snapshot.ids[index] for index in indexes]
+    scope = f"common-reachability:{','.join(map(str, node_ids))}:{direction}:{max_hops}"
+    offset = decode_cursor(cursor, scope)
+    if offset is None:
+        return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+    common = reachability.bitset(direction, indexes[0], max_hops)
+    for index in indexes[1:]:
+        if common == 0:
+            break
+        common &= reachability.bitset(direction, index, max_hops)
+    return json_response(
+        b'{"node_ids":',
+        encode_json(node_ids).encode(),
+        b',"direction":',
+        encode_json(direction).encode(),
+        b',"max_hops":',
+        str(max_hops).encode(),
+        *reachable_page(list(bitset_members(common)), scope, offset, limit),
+    )
 
 
-def run_server(bind: Optional[list[str]] = None):
-    global global_data  # pylint: disable=global-statement
-    global_data = reload()
+def find_history_build(
+    history: BuildHistory, build_time: Optional[str]
+) -> Optional[int]:
+    if build_time is None:
+        return len(history) - 1 if len(history) else None
+    return history.find(build_time)
+
+
+@app.get("/v1/history/builds")
+def get_history_builds() -> GetHistoryBuildsResponse:
+    return GetHistoryBuildsResponse(
+        builds=[
+            HistoryBuild.model_validate(build) for build in global_data.history.builds
+        ]
+    )
+
+
+@app.get("/v1/history/members/{member_id}")
+def get_history_member(member_id: int) -> GetHistoryMemberResponse:
+    return GetHistoryMemberResponse(
+        member_id=member_id,
+        metrics=[
+            MemberMetrics(build_time=build_time, **metrics)
+            for build_time, metrics in global_data.history.member_metrics(member_id)
+        ],
+    )
+
+
+@app.get(
+    "/v1/history/diff",
+    response_model=GetHistoryDiffResponse,
+    responses={404: {"model": GetHistoryErrorResponse}},
+)
+def get_history_diff(
+    from_build: str, to_build: Optional[str] = None
+) -> GetHistoryDiffResponse | JSONResponse:
+    # builds are found by time, the latest build at or before the given one
+    history = global_data.history
+    from_position = find_history_build(history, from_build)
+    to_position = find_history_build(history, to_build)
+    if from_position is None or to_position is None:
+        return JSONResponse(status_code=404, content={"detail": "Build not found"})
+    added, removed = history.edge_diff(from_position, to_position)
+    return GetHistoryDiffResponse(
+        from_build=history.builds[from_position]["build_time"],
+        to_build=history.builds[to_position]["build_time"],
+        added=[list(edge) for edge in added],
+        removed=[list(edge) for edge in removed],
+    )
+
+
+@app.get(
+    "/v1/history/distance/{source_id}/{target_id}",
+    response_model=GetHistoryDistanceResponse,
+    responses={404: {"model": GetHistoryErrorResponse}},
+)
+def get_history_distance(
+    source_id: int, target_id: int, at: Optional[str] = None
+) -> GetHistoryDistanceResponse | JSONResponse:
+    history = global_data.history
+    position = find_history_build(history, at)
+    if position is None:
+        return JSONResponse(status_code=404, content={"detail": "Build not found"})
+    distance = history.distance_at(position, source_id, target_id)
+    return GetHistoryDistanceResponse(
+        build_time=history.builds[position]["build_time"],
+        source_id=source_id,
+        target_id=target_id,
+        distance=distance if distance is not None else -1,
+    )
+
+
+def run_server(bind: Optional[list[str]] = None, workers: int = 1):
+    prepare_snapshot()
     config = Config()
     config.bind = bind or [":8471"]
-    asyncio.run(serve(app, config))  # type: ignore
+    if workers <= 1:
+        asyncio.run(serve(app, config))  # type: ignore
+    else:
+        config.application_path = "travellings_graph.server:app"
+        config.workers = workers
+        hypercorn_run(config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,386 @@
+import array
+import bisect
+import itertools
+import json
+import mmap
+import os
+import sys
+from collections.abc import Sequence
+from typing import Any, Iterable
+from travellings_graph.domain_utils import strip_host
+
+SNAPSHOT_MAGIC = b"TGSNAP01"
+SECTION_ALIGNMENT = 8
+GRAPH_SNAPSHOT_VERSION = 3
+
+ANALYSIS_INT_COLUMNS = [
+    "outgoing_count",
+    "outgoing_count_in6degrees",
+    "incoming_count",
+    "incoming_count_in6degrees",
+]
+ANALYSIS_FLOAT_COLUMNS = [
+    "outgoing_average_distance",
+    "incoming_average_distance",
+]
+ANALYSIS_STRING_COLUMNS = ["name", "url", "links"]
+# every numeric column gets a precomputed sort order, and the ID has one already
+ANALYSIS_SORT_KEYS = ["id"] + ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS
+
+
+def encode_sections(
+    meta: dict[str, Any], sections: dict[str, array.array | bytes]
+) -> bytes:
+    # Layout: magic, header length, JSON header, then each section aligned to 8 bytes.
+    # Arrays are stored in native byte order, a snapshot is not meant to leave the machine.
+    layout = {}
+    offset = 0
+    for name, data in sections.items():
+        typecode = data.typecode if isinstance(data, array.array) else "B"
+        length = len(data) * (data.itemsize if isinstance(data, array.array) else 1)
+        layout[name] = {"offset": offset, "length": length, "type": typecode}
+        offset += length + (-length) % SECTION_ALIGNMENT
+    header = json.dumps(
+        {"byteorder": sys.byteorder, "meta": meta, "sections": layout}
+    ).encode("utf-8")
+    base = len(SNAPSHOT_MAGIC) + 8 + len(header)
+    base += (-base) % SECTION_ALIGNMENT
+
+    buffer = bytearray(base + offset)
+    buffer[: len(SNAPSHOT_MAGIC)] = SNAPSHOT_MAGIC
+    buffer[len(SNAPSHOT_MAGIC) : len(SNAPSHOT_MAGIC) + 8] = len(header).to_bytes(
+        8, "little"
+    )
+    buffer[len(SNAPSHOT_MAGIC) + 8 : len(SNAPSHOT_MAGIC) + 8 + len(header)] = header
+    for name, data in sections.items():
+        start = base + layout[name]["offset"]
+        buffer[start : start + layout[name]["length"]] = (
+            data.tobytes() if isinstance(data, array.array) else data
+        )
+    return bytes(buffer)
+
+
+def write_sections(
+    path: str, meta: dict[str, Any], sections: dict[str, array.array | bytes]
+):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_sections(meta, sections))
+    # replace atomically, processes which mapped the old file keep reading the old one
+    os.replace(tmp_path, path)
+
+
+class SectionFile:
+    def __init__(self, buffer: bytes | mmap.mmap):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        if view[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("Invalid snapshot file")
+        header_length = int.from_bytes(
+            view[len(SNAPSHOT_MAGIC) : len(SNAPSHOT_MAGIC) + 8], "little"
+        )
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        header = json.loads(bytes(view[header_start : header_start + header_length]))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError("Snapshot was built on a machine with another byte order")
+        base = header_start + header_length
+        base += (-base) % SECTION_ALIGNMENT
+        self.meta: dict[str, Any] = header["meta"]
+        self.sections: dict[str, memoryview] = {}
+        for name, section in header["sections"].items():
+            start = base + section["offset"]
+            self.sections[name] = view[start : start + section["length"]].cast(
+                section["type"]
+            )
+
+    @staticmethod
+    def open(path: str) -> "SectionFile":
+        with open(path, "rb") as f:
+            # the mapping stays valid after the file is closed,
+            # and is shared by every process mapping it
+            return SectionFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def __getitem__(self, name: str) -> memoryview:
+        return self.sections[name]
+
+
+def pack_strings(values: list[str]) -> tuple[array.array, bytes]:
+    offsets = array.array("q", [0])
+    data = bytearray()
+    for value in values:
+        data += value.encode("utf-8")
+        offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+class StringTable(Sequence[str]):
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:  # type: ignore[override]
+        return str(self.data[self.offsets[index] : self.offsets[index + 1]], "utf-8")
+
+    def raw(self, index: int) -> memoryview:
+        return self.data[self.offsets[index] : self.offsets[index + 1]]
+
+
+def encode_json(value: Any) -> str:
+    # the same encoding as FastAPI's JSONResponse, so fragments can be spliced into responses
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+def build_csr(lists: list[list[int]]) -> tuple[array.array, array.array]:
+    offsets = array.array("q", [0])
+    targets = array.array("i")
+    for items in lists:
+        targets.extend(items)
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+def host_sections(items: list[dict[str, Any]]) -> dict[str, array.array | bytes]:
+    # stable sort, so the last one of duplicated hosts is found by bisect_right - 1,
+    # like a dict built in order would do
+    hosts = [strip_host(item["url"]) for item in items]
+    host_order = sorted(range(len(hosts)), key=lambda index: hosts[index])
+    offsets, data = pack_strings([hosts[index] for index in host_order])
+    return {
+        "host_sorted_offsets": offsets,
+        "host_sorted_data": data,
+        "host_sorted_index": array.array("i", host_order),
+    }
+
+
+def graph_snapshot_sections(
+    items: list[dict[str, Any]], edges: Iterable[tuple[int, int]]
+) -> dict[str, array.array | bytes]:
+    # Nodes are indexed densely in the order of `items` (the order of analysis.csv).
+    ids = array.array("i", (item["id"] for item in items))
+    index_of = {node_id: index for index, node_id in enumerate(ids)}
+    out_lists: list[list[int]] = [[] for _ in items]
+    in_lists: list[list[int]] = [[] for _ in items]
+    for source_id, target_id in edges:
+        source = index_of.get(source_id)
+        target = index_of.get(target_id)
+        if source is None or target is None:
+            continue
+        out_lists[source].append(target)
+        in_lists[target].append(source)
+
+    sections: dict[str, array.array | bytes] = {"ids": ids}
+    id_order = sorted(range(len(ids)), key=lambda index: ids[index])
+    sections["id_sorted"] = array.array("i", (ids[index] for index in id_order))
+    sections["id_sorted_index"] = array.array("i", id_order)
+
+    sections["out_offsets"], sections["out_targets"] = build_csr(out_lists)
+    sections["in_offsets"], sections["in_sources"] = build_csr(in_lists)
+
+    for column in ANALYSIS_INT_COLUMNS:
+        sections[column] = array.array("q", (item[column] for item in items))
+    for column in ANALYSIS_FLOAT_COLUMNS:
+        sections[column] = array.array("d", (item[column] for item in items))
+    for column in ANALYSIS_STRING_COLUMNS:
+        sections[f"{column}_offsets"], sections[f"{column}_data"] = pack_strings(
+            [item[column] for item in items]
+        )
+    # ascending permutations of the node indexes, ties kept in the order of `items`
+    for column in ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS:
+        sections[f"{column}_order"] = array.array(
+            "i",
+            sorted(
+                range(len(items)), key=lambda index, column=column: items[index][column]
+            ),
+        )
+
+    # pre-encoded BlogBrief of each node, and the lists of them for each node's neighbours
+    briefs = [
+        encode_json({"id": item["id"], "name": item["name"], "url": item["url"]})
+        for item in items
+    ]
+    sections["brief_offsets"], sections["brief_data"] = pack_strings(briefs)
+    sections["out_json_offsets"], sections["out_json_data"] = pack_strings(
+        [
+            "[" + ",".join(briefs[target] for target in targets) + "]"
+            for targets in out_lists
+        ]
+    )
+    sections["in_json_offsets"], sections["in_json_data"] = pack_strings(
+        [
+            "[" + ",".join(briefs[source] for source in sources) + "]"
+            for sources in in_lists
+        ]
+    )
+
+    sections.update(host_sections(items))
+    return sections
+
+
+def write_graph_snapshot(
+    path: str,
+    build_info: dict[str, Any],
+    items: list[dict[str, Any]],
+    edges: Iterable[tuple[int, int]],
+):
+    write_sections(
+        path,
+        {"version": GRAPH_SNAPSHOT_VERSION, "build_info": build_info},
+        graph_snapshot_sections(items, edges),
+    )
+
+
+# one attribute for each section
+class GraphSnapshot:  # pylint: disable=too-many-instance-attributes
+    def __init__(self, file: SectionFile):
+        self.file = file
+        self.meta = file.meta
+        self.ids = file["ids"]
+        self.id_sorted = file["id_sorted"]
+        self.id_sorted_index = file["id_sorted_index"]
+        self.out_offsets = file["out_offsets"]
+        self.out_targets = file["out_targets"]
+        self.in_offsets = file["in_offsets"]
+        self.in_sources = file["in_sources"]
+        self.columns: dict[str, memoryview] = {
+            column: file[column]
+            for column in ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS
+        }
+        self.sort_orders: dict[str, memoryview] = {"id": self.id_sorted_index}
+        for column in ANALYSIS_INT_COLUMNS + ANALYSIS_FLOAT_COLUMNS:
+            self.sort_orders[column] = file[f"{column}_order"]
+        self.names = StringTable(file["name_offsets"], file["name_data"])
+        self.urls = StringTable(file["url_offsets"], file["url_data"])
+        self.links = StringTable(file["links_offsets"], file["links_data"])
+        self.hosts_sorted = StringTable(
+            file["host_sorted_offsets"], file["host_sorted_data"]
+        )
+        self.host_sorted_index = file["host_sorted_index"]
+        self.briefs_json = StringTable(file["brief_offsets"], file["brief_data"])
+        self.successors_json = StringTable(
+            file["out_json_offsets"], file["out_json_data"]
+        )
+        self.predecessors_json = StringTable(
+            file["in_json_offsets"], file["in_json_data"]
+        )
+
+    @staticmethod
+    def open(path: str = "graph.snapshot") -> "GraphSnapshot":
+        file = SectionFile.open(path)
+        if file.meta.get("version") != GRAPH_SNAPSHOT_VERSION:
+            raise ValueError(
+                "Snapshot was written by another version, please analyze again"
+            )
+        return GraphSnapshot(file)
+
+    @staticmethod
+    def empty() -> "GraphSnapshot":
+        return GraphSnapshot(
+            SectionFile(
+                encode_sections(
+                    {"version": GRAPH_SNAPSHOT_VERSION, "build_info": None},
+                    graph_snapshot_sections([], []),
+                )
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.out_targets)
+
+    def index_of_id(self, node_id: int) -> int | None:
+        position = bisect.bisect_left(self.id_sorted, node_id)
+        if position < len(self.id_sorted) and self.id_sorted[position] == node_id:
+            return self.id_sorted_index[position]
+        return None
+
+    def index_of_host(self, host: str) -> int | None:
+        position = bisect.bisect_right(self.hosts_sorted, host) - 1
+        if position >= 0 and self.hosts_sorted[position] == host:
+            return self.host_sorted_index[position]
+        return None
+
+    def ordered(self, sort: str = "", descending: bool = False) -> Sequence[int]:
+        # node indexes in the order of a sort key, or of analysis.csv without one
+        if sort == "":
+            order: Sequence[int] = range(len(self))
+        else:
+            order = self.sort_orders[sort]
+        return order[::-1] if descending else order
+
+    def successors(self, index: int) -> memoryview:
+        return self.out_targets[self.out_offsets[index] : self.out_offsets[index + 1]]
+
+    def predecessors(self, index: int) -> memoryview:
+        return self.in_sources[self.in_offsets[index] : self.in_offsets[index + 1]]
+
+    def neighbors(self, index: int, direction: str) -> Iterable[int]:
+        if direction == "out":
+            return self.successors(index)
+        if direction == "in":
+            return self.predecessors(index)
+        return itertools.chain(self.successors(index), self.predecessors(index))
+
+    def neighborhood(
+        self, source: int, depth: int, direction: str, max_nodes: int
+    ) -> tuple[list[int], list[int], bool]:
+        # depth-bounded BFS, returns the nodes in BFS order with their distances,
+        # and whether it stopped early because of max_nodes
+        visited = bytearray(len(self))
+        visited[source] = 1
+        nodes = [source]
+        distances = [0]
+        frontier = [source]
+        for distance in range(1, depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for neighbor in self.neighbors(node, direction):
+                    if visited[neighbor]:
+                        continue
+                    if len(nodes) >= max_nodes:
+                        return nodes, distances, True
+                    visited[neighbor] = 1
+                    nodes.append(neighbor)
+                    distances.append(distance)
+                    next_frontier.append(neighbor)
+            if len(next_frontier) == 0:
+                break
+            frontier = next_frontier
+        return nodes, distances, False
+
+    def shortest_paths(self, source: int, target: int) -> list[list[int]]:
+        # all shortest paths from source to target (by index), empty if there is no path
+        if source == target:
+            return [[source]]
+        parents: dict[int, list[int]] = {source: []}
+        frontier = [source]
+        while frontier and target not in parents:
+            level: dict[int, list[int]] = {}
+            for node in frontier:
+                for successor in self.successors(node):
+                    if successor in parents:
+                        continue
+                    level.setdefault(successor, []).append(node)
+            parents.update(level)
+            frontier = list(level)
+        if target not in parents:
+            return []
+
+        paths = []
+        stack = [[target]]
+        while stack:
+            path = stack.pop()
+            if path[-1] == source:
+                paths.append(path[::-1])
+                continue
+            for parent in parents[path[-1]]:
+                stack.append(path + [parent])
+        return paths